@@ -0,0 +1,375 @@
+"""
+Online backups for the StreamTracker API.
+
+Snapshots are taken with SQLite's online backup API in a single step,
+ which reads the database in one read transaction. The database runs in
+ WAL mode, where reading does not block writers, so writers keep going
+ while a snapshot is being copied. (A copy made a few pages per step
+ would restart whenever another connection commits, and could never
+ finish under steady writes.)
+ Differential exports hold only the rows changed, and the items deleted,
+ since the last snapshot, as gzip-compressed JSON. Restoring copies a
+ snapshot back page by page and then applies the differentials taken on
+ top of it, which is much faster than replaying a JSON export.
+
+Every catalog has its own backups: the default catalog's in backups/ next
+ to the database, each tenant catalog's in backups/tenants/<name>/. The
+ scheduler covers the default catalog and every tenant file on disk.
+
+These backups are for the SQLite backend; PostgreSQL deployments use the
+ server's own tools (pg_dump, continuous archiving) instead.
+"""
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+
+import directors
+import events
+import schemas
+import sync
+import tenants
+import title_index
+from database import IS_SQLITE, Catalog, db_path, default_catalog
+from locks import ProcessLock
+
+BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(db_path)), "backups")
+# Scheduled snapshot interval in hours (0 disables scheduled snapshots)
+SNAPSHOT_INTERVAL_HOURS = float(os.environ.get("STREAMTRACKER_SNAPSHOT_INTERVAL_HOURS", "24"))
+# Scheduled differential export interval in minutes (0 disables them)
+DIFFERENTIAL_INTERVAL_MINUTES = float(os.environ.get("STREAMTRACKER_DIFFERENTIAL_INTERVAL_MINUTES", "60"))
+# Number of snapshots kept; older snapshots and their differentials are deleted
+SNAPSHOT_RETENTION = int(os.environ.get("STREAMTRACKER_SNAPSHOT_RETENTION", "7"))
+
+_SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{8}T\d{6})-(\d+)\.db$")
+_DIFFERENTIAL_NAME = re.compile(r"^diff-(\d{8}T\d{6})-(\d+)-(\d+)\.json\.gz$")
+
+# Backups of tenant catalogs, one folder per tenant
+TENANT_BACKUP_DIR = os.path.join(BACKUP_DIR, "tenants")
+
+
+class BackupError(RuntimeError):
+    """Raised when a backup file is missing or cannot be used"""
+
+
+def _require_sqlite() -> None:
+    if not IS_SQLITE:
+        raise BackupError("Backups are only available with the SQLite backend; use pg_dump for PostgreSQL")
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime("%Y%m%dT%H%M%S")
+
+
+def backup_dir(tenant: Optional[str] = None) -> str:
+    """Folder holding the snapshots and differentials of a tenant's catalog (or the default one)"""
+    return BACKUP_DIR if tenant is None else os.path.join(TENANT_BACKUP_DIR, tenant)
+
+
+def _lock(catalog: Catalog) -> ProcessLock:
+    # Only one backup or restore of a catalog runs at a time, across all worker processes
+    return ProcessLock("backup", catalog.db_path)
+
+
+def _describe(directory: str, name: str) -> Optional[dict]:
+    path = os.path.join(directory, name)
+    snapshot = _SNAPSHOT_NAME.match(name)
+    if snapshot:
+        return {"name": name, "kind": "snapshot", "seq": int(snapshot.group(2)),
+                "from_seq": None, "size": os.path.getsize(path)}
+    differential = _DIFFERENTIAL_NAME.match(name)
+    if differential:
+        return {"name": name, "kind": "differential", "seq": int(differential.group(3)),
+                "from_seq": int(differential.group(2)), "size": os.path.getsize(path)}
+    return None
+
+
+def list_backups(catalog: Catalog = default_catalog) -> List[dict]:
+    """List a catalog's snapshots and differentials, oldest first"""
+    return _list(backup_dir(catalog.name))
+
+
+def _list(directory: str) -> List[dict]:
+    if not os.path.isdir(directory):
+        return []
+    backups = [_describe(directory, name) for name in os.listdir(directory)]
+    return sorted((b for b in backups if b), key=lambda b: (b["seq"], b["kind"] == "differential", b["name"]))
+
+
+def _latest_snapshot(directory: str) -> Optional[dict]:
+    snapshots = [b for b in _list(directory) if b["kind"] == "snapshot"]
+    return snapshots[-1] if snapshots else None
+
+
+def create_snapshot(catalog: Catalog = default_catalog) -> dict:
+    """Copy a catalog's live database into a new snapshot file without blocking writers"""
+    _require_sqlite()
+    with _lock(catalog):
+        return _take_snapshot(catalog)
+
+
+def _take_snapshot(catalog: Catalog) -> dict:
+    directory = backup_dir(catalog.name)
+    os.makedirs(directory, exist_ok=True)
+    partial = os.path.join(directory, f".snapshot-{_timestamp()}.partial")
+    raw = catalog.engine.raw_connection()
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            # One step: a consistent image as of its read transaction, whatever is committed meanwhile
+            raw.driver_connection.backup(target, pages=-1)
+            # The copy is a consistent image, so its own sequence says what it contains
+            seq = target.execute("SELECT last_seq FROM sync_state WHERE id = 1").fetchone()[0]
+        finally:
+            target.close()
+    finally:
+        raw.close()
+    name = f"snapshot-{_timestamp()}-{seq}.db"
+    os.replace(partial, os.path.join(directory, name))
+    _apply_retention(directory)
+    return _describe(directory, name)
+
+
+def create_differential(catalog: Catalog = default_catalog) -> Optional[dict]:
+    """
+    Export a catalog's rows changed since its latest snapshot (or the
+    differential on top of it) as gzip-compressed JSON. Returns None if
+    nothing has changed.
+    """
+    _require_sqlite()
+    directory = backup_dir(catalog.name)
+    with _lock(catalog):
+        snapshot = _latest_snapshot(directory)
+        if snapshot is None:
+            raise BackupError("A snapshot is needed before a differential export")
+        chain = _differential_chain(directory, snapshot)
+        since = chain[-1]["seq"] if chain else snapshot["seq"]
+
+        db = catalog.SessionLocal()
+        try:
+            changes = sync.changes_since(db, since)
+            if changes["reset"]:
+                raise BackupError("Changes since the last snapshot are no longer tracked; take a new snapshot")
+            to_seq = int(changes["token"])
+            if to_seq == since:
+                return None
+            payload = {
+                "snapshot": snapshot["name"],
+                "from_seq": since,
+                "to_seq": to_seq,
+                "created_at": datetime.now().isoformat(),
+                "movies": [_row_dict(row) for row in changes["movies"]],
+                "tv_shows": [_row_dict(row) for row in changes["tv_shows"]],
+                "deleted": changes["deleted"],
+            }
+        finally:
+            db.close()
+
+        name = f"diff-{_timestamp()}-{since}-{to_seq}.json.gz"
+        partial = os.path.join(directory, f".{name}.partial")
+        with gzip.open(partial, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(partial, os.path.join(directory, name))
+        return _describe(directory, name)
+
+
+def _row_dict(row) -> dict:
+    schema = schemas.Movie if hasattr(row, "director") else schemas.TVShow
+    return schema.model_validate(row).model_dump()
+
+
+def _differential_chain(directory: str, snapshot: dict) -> List[dict]:
+    """Differentials of a backup folder that apply, in order, on top of one of its snapshots"""
+    differentials = {b["from_seq"]: b for b in _list(directory) if b["kind"] == "differential"}
+    chain = []
+    seq = snapshot["seq"]
+    while seq in differentials:
+        chain.append(differentials[seq])
+        seq = differentials[seq]["seq"]
+    return chain
+
+
+def _apply_differential(conn: sqlite3.Connection, path: str) -> None:
+    """
+    Apply a differential export with plain SQL. Normalized titles (and
+    director links) are reset so they are rebuilt for the touched rows
+    afterwards.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    for item in payload["deleted"]:
+        table = "movies" if item["type"] == "movie" else "tv_shows"
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (item["id"],))
+        conn.execute("DELETE FROM title_trigrams WHERE item_type = ? AND item_id = ?", (item["type"], item["id"]))
+    for table, rows in (("movies", payload["movies"]), ("tv_shows", payload["tv_shows"])):
+        reset = ["title_normalized"] + (["director_id"] if table == "movies" else [])
+        for row in rows:
+            columns = list(row)
+            updates = ", ".join(
+                [f"{column} = excluded.{column}" for column in columns if column != "id"]
+                + [f"{column} = NULL" for column in reset]
+            )
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns + reset)}) "
+                f"VALUES ({', '.join(['?'] * len(columns) + ['NULL'] * len(reset))}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                [row[column] for column in columns],
+            )
+
+
+def restore(name: str, apply_differentials: bool = True, catalog: Catalog = default_catalog) -> dict:
+    """
+    Replace a catalog's live database with one of its snapshots, then apply the differentials
+    taken on top of it. Sync clients are forced to resync afterwards. The
+    restored state is snapshotted again, since changes from before the
+    restore are no longer tracked: later differentials build on that new
+    snapshot, which is also the latest one whichever snapshot was restored.
+    """
+    _require_sqlite()
+    directory = backup_dir(catalog.name)
+    with _lock(catalog):
+        snapshot = _describe(directory, name) if os.path.exists(os.path.join(directory, name)) else None
+        if snapshot is None or snapshot["kind"] != "snapshot":
+            raise BackupError(f"Snapshot {name!r} not found")
+        chain = _differential_chain(directory, snapshot) if apply_differentials else []
+
+        started = time.perf_counter()
+        with catalog.engine.connect() as conn:
+            previous_seq = conn.execute(text("SELECT last_seq FROM sync_state WHERE id = 1")).scalar() or 0
+
+        raw = catalog.engine.raw_connection()
+        try:
+            source = sqlite3.connect(os.path.join(directory, name))
+            try:
+                # All pages in one step: the live database is replaced atomically
+                source.backup(raw.driver_connection, pages=-1)
+            finally:
+                source.close()
+            live = raw.driver_connection
+            for differential in chain:
+                _apply_differential(live, os.path.join(directory, differential["name"]))
+            # Jump past every token handed out before the restore, so clients resync
+            new_seq = max(previous_seq, snapshot["seq"], *(d["seq"] for d in chain)) + 1
+            live.execute("UPDATE sync_state SET last_seq = ?, pruned_seq = ? WHERE id = 1", (new_seq, new_seq))
+            live.commit()
+        finally:
+            raw.close()
+
+        with catalog.engine.connect() as conn:
+            title_index.backfill_title_index(conn)
+            # Deleted and changed rows moved counts between directors: recount them all
+            directors.backfill_directors(conn, rebuild=True)
+            conn.commit()
+        events.broker.publish([{"event": "resync", "seq": new_seq}], catalog.name)
+        restored = _take_snapshot(catalog)
+        return {
+            "snapshot": name,
+            "differentials_applied": len(chain),
+            "new_snapshot": restored["name"],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+def _apply_retention(directory: str) -> None:
+    """Keep the newest SNAPSHOT_RETENTION snapshots of a folder and the differentials that build on them"""
+    backups = _list(directory)
+    snapshots = [b for b in backups if b["kind"] == "snapshot"]
+    if len(snapshots) <= SNAPSHOT_RETENTION:
+        return
+    oldest_kept = snapshots[-SNAPSHOT_RETENTION]["seq"]
+    expired = snapshots[:-SNAPSHOT_RETENTION]
+    expired += [b for b in backups if b["kind"] == "differential" and b["from_seq"] < oldest_kept]
+    for backup in expired:
+        os.remove(os.path.join(directory, backup["name"]))
+
+
+class BackupScheduler:
+    """Background thread taking the scheduled snapshots and differential exports of every catalog"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not IS_SQLITE or (SNAPSHOT_INTERVAL_HOURS <= 0 and DIFFERENTIAL_INTERVAL_MINUTES <= 0):
+            return
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Backup warning: {e}")
+            self._stop.wait(60)
+
+    def run_pending(self) -> None:
+        """Take whatever snapshot or differential is due, for the default catalog and every tenant"""
+        for tenant in [None] + _tenant_names():
+            if self._stop.is_set():
+                return
+            try:
+                self._run_catalog(tenant)
+            except Exception as e:
+                print(f"Backup warning ({tenant or 'default catalog'}): {e}")
+
+    def _run_catalog(self, tenant: Optional[str]) -> None:
+        # What is due is read from the backup files, so idle tenants are not opened
+        due = _due(backup_dir(tenant))
+        if due is None:
+            return
+        catalog = tenants.catalogs.acquire(tenant)
+        try:
+            if due == "snapshot":
+                create_snapshot(catalog)
+            else:
+                create_differential(catalog)
+        finally:
+            tenants.catalogs.release(catalog)
+
+
+def _tenant_names() -> List[str]:
+    """Tenants with a catalog file (WAL and lock files next to them are skipped)"""
+    if not os.path.isdir(tenants.TENANT_DIR):
+        return []
+    names = []
+    for file_name in os.listdir(tenants.TENANT_DIR):
+        if not file_name.endswith(".db"):
+            continue
+        try:
+            if tenants.tenant_name(file_name[:-3]) == file_name[:-3]:
+                names.append(file_name[:-3])
+        except tenants.InvalidTenant:
+            continue
+    return sorted(names)
+
+
+def _due(directory: str) -> Optional[str]:
+    """'snapshot' or 'differential' if one is due in a backup folder, else None"""
+    now = time.time()
+    snapshot = _latest_snapshot(directory)
+    snapshot_age = now - os.path.getmtime(os.path.join(directory, snapshot["name"])) if snapshot else None
+    if SNAPSHOT_INTERVAL_HOURS > 0 and (snapshot is None or snapshot_age >= SNAPSHOT_INTERVAL_HOURS * 3600):
+        return "snapshot"
+    if DIFFERENTIAL_INTERVAL_MINUTES > 0 and snapshot is not None:
+        chain = _differential_chain(directory, snapshot)
+        last = os.path.join(directory, chain[-1]["name"] if chain else snapshot["name"])
+        if now - os.path.getmtime(last) >= DIFFERENTIAL_INTERVAL_MINUTES * 60:
+            return "differential"
+    return None
+
+
+scheduler = BackupScheduler()
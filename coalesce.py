@@ -0,0 +1,80 @@
+"""
+Request coalescing (single-flight) for expensive read endpoints.
+
+Concurrent requests for the same key share one computation, run in the
+ threadpool, and its serialized result. Each computation is tagged with the
+ catalog change sequence seen when it started: a request only joins one
+ that is at least as new as the catalog it saw, so nobody is served data
+ from before a write they could already observe. At most one computation
+ runs per key, and a key admits a bounded number of requests at a time.
+"""
+import asyncio
+from typing import Callable, Dict
+
+from starlette.concurrency import run_in_threadpool
+
+# Requests waiting on or running one key at a time; further ones are refused
+MAX_ADMITTED_PER_KEY = 64
+
+
+class Overloaded(RuntimeError):
+    """Raised when a key already has MAX_ADMITTED_PER_KEY requests in progress"""
+
+
+class _Flight:
+    def __init__(self, version: int, task: asyncio.Task):
+        self.version = version
+        self.task = task
+
+
+class SingleFlight:
+    """Share in-flight computations between concurrent identical requests"""
+
+    def __init__(self, max_admitted: int = MAX_ADMITTED_PER_KEY):
+        self.max_admitted = max_admitted
+        self._flights: Dict[str, _Flight] = {}
+        self._admitted: Dict[str, int] = {}
+        self.computations = 0
+        self.shared = 0
+
+    def _start(self, key: str, version: int, compute: Callable[[], bytes]) -> _Flight:
+        # The computation is its own task, so a client disconnecting does not
+        # cancel it for the other requests sharing it
+        flight = _Flight(version, asyncio.ensure_future(run_in_threadpool(compute)))
+        self._flights[key] = flight
+        self.computations += 1
+
+        def finished(task: asyncio.Task) -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if not task.cancelled():
+                task.exception()  # retrieved here in case every waiter has gone
+
+        flight.task.add_done_callback(finished)
+        return flight
+
+    async def run(self, key: str, version: int, compute: Callable[[], bytes]) -> bytes:
+        """Result of `compute` for `key` from a computation that started at `version` or later"""
+        if self._admitted.get(key, 0) >= self.max_admitted:
+            raise Overloaded(f"Too many concurrent requests for {key}")
+        self._admitted[key] = self._admitted.get(key, 0) + 1
+        try:
+            while True:
+                flight = self._flights.get(key)
+                if flight is None or flight.task.done():
+                    flight = self._start(key, version, compute)
+                elif flight.version < version:
+                    # Started before a write this request has seen: wait for it
+                    # to finish, then start (or join) a fresh one
+                    await asyncio.wait({flight.task})
+                    continue
+                else:
+                    self.shared += 1
+                return await asyncio.shield(flight.task)
+        finally:
+            self._admitted[key] -= 1
+            if not self._admitted[key]:
+                del self._admitted[key]
+
+
+flights = SingleFlight()
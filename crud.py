@@ -3,19 +3,56 @@ CRUD utility functions for the StreamTracker API.
 Encapsulates database operations for fetching, creating, updating,
 and deleting movie and TV show entries.
 """
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import asc, desc, func
+from sqlalchemy import Integer, asc, cast, desc, false, func, literal_column, text
+import directors
 import models
 import schemas
-
-
-def get_movies(
+import search_index
+import title_index
+from database import IS_SQLITE
+
+# Number of directors reported in the facet counts of /movies/?facets=true
+FACET_TOP_DIRECTORS = 10
+# Rows fetched per batch when streaming the whole catalog for an export
+EXPORT_BATCH_SIZE = 1000
+
+
+def _apply_catalog_filters(
+    query,
+    model,
+    watched: Optional[bool] = None,
+    min_rating: Optional[float] = None,
+    max_rating: Optional[float] = None,
+    min_year: Optional[int] = None,
+    max_year: Optional[int] = None,
+    decade: Optional[int] = None,
+):
+    """Apply the shared watched/rating/year filters to a movie or TV show query"""
+    if watched is not None:
+        query = query.filter(model.watched == watched)
+    if min_rating is not None:
+        query = query.filter(model.rating >= min_rating)
+    if max_rating is not None:
+        query = query.filter(model.rating <= max_rating)
+    if min_year is not None:
+        query = query.filter(model.year >= min_year)
+    if max_year is not None:
+        query = query.filter(model.year <= max_year)
+    if decade is not None:
+        # Expressed as a range so the year index can be used
+        decade_start = (decade // 10) * 10
+        query = query.filter(model.year >= decade_start, model.year < decade_start + 10)
+    return query
+
+
+def _filtered_movies_query(
     db: Session,
     search: Optional[str] = None,
-    sort_by: Optional[str] = None,
-    order: Optional[str] = None,
-) -> List[models.Movie]:
+    director: Optional[str] = None,
+    **filters,
+):
     query = db.query(models.Movie)
     if search:
         like_pattern = f"%{search}%"
@@ -23,6 +60,96 @@ def get_movies(
             models.Movie.title.ilike(like_pattern) |
             models.Movie.director.ilike(like_pattern)
         )
+    if director:
+        # Any spelling of the director's name matches, through the director id index
+        director_id = directors.find_id(db, director)
+        query = query.filter(models.Movie.director_id == director_id if director_id is not None else false())
+    return _apply_catalog_filters(query, models.Movie, **filters)
+
+
+def _filtered_tv_shows_query(db: Session, search: Optional[str] = None, **filters):
+    query = db.query(models.TVShow)
+    if search:
+        like_pattern = f"%{search}%"
+        query = query.filter(
+            models.TVShow.title.ilike(like_pattern)
+        )
+    return _apply_catalog_filters(query, models.TVShow, **filters)
+
+
+def _facet_counts(query) -> dict:
+    """
+    Compute watched, rating bucket and decade counts for a filtered query.
+    Each facet is a single GROUP BY over the filtered rows.
+    """
+    filtered = query.order_by(None).subquery()
+    watched_rows = query.session.query(
+        filtered.c.watched, func.count()
+    ).group_by(filtered.c.watched).all()
+
+    # CAST truncates on SQLite but rounds on PostgreSQL, which needs an explicit floor
+    rating_bucket = cast(filtered.c.rating if IS_SQLITE else func.floor(filtered.c.rating), Integer)
+    rating_rows = query.session.query(
+        rating_bucket, func.count()
+    ).group_by(rating_bucket).all()
+
+    decade_bucket = (filtered.c.year // 10) * 10
+    decade_rows = query.session.query(
+        decade_bucket, func.count()
+    ).filter(filtered.c.year.isnot(None)).group_by(decade_bucket).all()
+
+    watched_counts = {"watched": 0, "unwatched": 0}
+    for watched, count in watched_rows:
+        watched_counts["watched" if watched else "unwatched"] += count
+
+    return {
+        "total": sum(watched_counts.values()),
+        "watched": watched_counts,
+        "rating": {
+            (str(bucket) if bucket is not None else "unrated"): count
+            for bucket, count in sorted(rating_rows, key=lambda r: (r[0] is None, r[0] or 0))
+        },
+        "decade": {f"{int(decade)}s": count for decade, count in sorted(decade_rows)},
+    }
+
+
+def get_movie_facets(db: Session, **filters) -> dict:
+    """Get facet counts (watched, rating, decade, top directors) for a movie filter set"""
+    query = _filtered_movies_query(db, **filters)
+    facets = _facet_counts(query)
+
+    if not any(value is not None for value in filters.values()):
+        # Unfiltered: the maintained per-director counts answer this directly
+        director_rows = db.query(models.Director.name, models.Director.movie_count).filter(
+            models.Director.movie_count > 0
+        ).order_by(models.Director.movie_count.desc(), models.Director.name).limit(FACET_TOP_DIRECTORS).all()
+    else:
+        filtered = query.order_by(None).subquery()
+        director_rows = db.query(
+            models.Director.name, func.count().label("count")
+        ).join(filtered, filtered.c.director_id == models.Director.id).group_by(models.Director.id).order_by(
+            func.count().desc(), models.Director.name
+        ).limit(FACET_TOP_DIRECTORS).all()
+    facets["directors"] = [{"director": d[0], "count": d[1]} for d in director_rows]
+    return facets
+
+
+def get_tv_show_facets(db: Session, **filters) -> dict:
+    """Get facet counts (watched, rating, decade) for a TV show filter set"""
+    query = _filtered_tv_shows_query(db, **filters)
+    facets = _facet_counts(query)
+    facets["directors"] = []
+    return facets
+
+
+def get_movies(
+    db: Session,
+    search: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    order: Optional[str] = None,
+    **filters,
+) -> List[models.Movie]:
+    query = _filtered_movies_query(db, search=search, **filters)
     sort_order = asc  # default
     if order and order.lower() == "desc":
         sort_order = desc
@@ -71,13 +198,9 @@ def get_tv_shows(
     search: Optional[str] = None,
     sort_by: Optional[str] = None,
     order: Optional[str] = None,
+    **filters,
 ) -> List[models.TVShow]:
-    query = db.query(models.TVShow)
-    if search:
-        like_pattern = f"%{search}%"
-        query = query.filter(
-            models.TVShow.title.ilike(like_pattern)
-        )
+    query = _filtered_tv_shows_query(db, search=search, **filters)
     sort_order = asc  # default
     if order and order.lower() == "desc":
         sort_order = desc
@@ -120,6 +243,133 @@ def delete_tv_show(db: Session, tv_show_id: int) -> Optional[models.TVShow]:
     return db_tv_show
 
 
+# Cross-catalog search functions
+def _ranked_search_hits(
+    db: Session,
+    q: str,
+    count: int,
+    item_type: Optional[str] = None,
+    column: Optional[str] = None,
+) -> list:
+    """
+    Get the (rowid, title) of the best `count` search hits: whole-word matches
+    first, then prefix-only matches, each tier ordered by bm25 (titles weighted highest).
+    Every hit of a tier is ranked, so the best ones are never left out, and
+    ties are broken by rowid so that pages neither overlap nor skip hits.
+    """
+    if not IS_SQLITE:
+        return search_index.pg_search_hits(db, q, count, item_type=item_type, column=column)
+    type_filter = search_index.type_filter_sql(item_type)
+    hits = []
+    for match in search_index.build_match_tiers(q, column=column):
+        remaining = count - len(hits)
+        if remaining <= 0:
+            break
+        hits.extend(db.execute(
+            text(
+                "SELECT rowid, title FROM catalog_search "
+                f"WHERE catalog_search MATCH :match{type_filter} "
+                "ORDER BY bm25(catalog_search, 10.0, 2.0), rowid LIMIT :remaining"
+            ),
+            {"match": match, "remaining": remaining},
+        ).all())
+    return hits
+
+
+def search_catalog(
+    db: Session,
+    q: str,
+    item_type: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """Search movies and TV shows together, returning one relevance-ranked page"""
+    if IS_SQLITE:
+        type_filter = search_index.type_filter_sql(item_type)
+        total = sum(
+            db.execute(
+                text(f"SELECT count(*) FROM catalog_search WHERE catalog_search MATCH :match{type_filter}"),
+                {"match": match},
+            ).scalar()
+            for match in search_index.build_match_tiers(q)
+        )
+    else:
+        total = search_index.pg_search_count(db, q, item_type=item_type)
+    if total == 0:
+        return _fuzzy_search_catalog(db, q, item_type=item_type, limit=limit, offset=offset)
+    hits = _ranked_search_hits(db, q, offset + limit, item_type=item_type)[offset:]
+
+    keys = [search_index.split_rowid(rowid) for rowid, _ in hits]
+    movie_ids = [item_id for kind, item_id in keys if kind == search_index.MOVIE]
+    tv_ids = [item_id for kind, item_id in keys if kind == search_index.TV_SHOW]
+    rows = {}
+    if movie_ids:
+        for movie in db.query(models.Movie).filter(models.Movie.id.in_(movie_ids)):
+            rows[(search_index.MOVIE, movie.id)] = movie
+    if tv_ids:
+        for tv_show in db.query(models.TVShow).filter(models.TVShow.id.in_(tv_ids)):
+            rows[(search_index.TV_SHOW, tv_show.id)] = tv_show
+
+    items = [_search_item(key[0], rows[key]) for key in keys if key in rows]
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
+
+
+def _search_item(item_type: str, row) -> dict:
+    return {
+        "type": item_type,
+        "id": row.id,
+        "title": row.title,
+        "director": getattr(row, "director", None),
+        "year": row.year,
+        "rating": row.rating,
+        "watched": row.watched,
+        "poster_url": row.poster_url,
+    }
+
+
+def _fuzzy_search_catalog(
+    db: Session,
+    q: str,
+    item_type: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """
+    Fallback for searches with no full-text hits: rank titles by trigram
+    similarity. Every match is scored to count the total, but only the
+    rows of the requested page are loaded.
+    """
+    scored = []
+    for kind, model in ((search_index.MOVIE, models.Movie), (search_index.TV_SHOW, models.TVShow)):
+        if item_type is None or item_type == kind:
+            scored.extend((score, kind, item_id) for item_id, score in title_index.rank_similar(db, model, q))
+    scored.sort(key=lambda hit: (-hit[0], hit[1], hit[2]))
+    page = scored[offset:offset + limit]
+
+    rows = {}
+    for kind, model in ((search_index.MOVIE, models.Movie), (search_index.TV_SHOW, models.TVShow)):
+        ids = [item_id for _, hit_kind, item_id in page if hit_kind == kind]
+        if ids:
+            for row in db.query(model).filter(model.id.in_(ids)):
+                rows[(kind, row.id)] = row
+    items = [_search_item(kind, rows[kind, item_id]) for _, kind, item_id in page if (kind, item_id) in rows]
+    return {"items": items, "total": len(scored), "limit": limit, "offset": offset}
+
+
+def autocomplete_catalog(
+    db: Session,
+    q: str,
+    item_type: Optional[str] = None,
+    limit: int = 10,
+) -> List[dict]:
+    """Prefix-match titles across movies and TV shows, returning only ids and titles"""
+    results = []
+    for rowid, title in _ranked_search_hits(db, q, limit, item_type=item_type, column="title"):
+        kind, item_id = search_index.split_rowid(rowid)
+        results.append({"type": kind, "id": item_id, "title": title})
+    return results
+
+
 # Export/Import functions
 def get_all_movies(db: Session) -> List[models.Movie]:
     """Get all movies for export"""
@@ -131,23 +381,68 @@ def get_all_tv_shows(db: Session) -> List[models.TVShow]:
     return db.query(models.TVShow).all()
 
 
+def iter_all_movies(db: Session) -> Iterator[models.Movie]:
+    """Stream every movie in batches (through a server-side cursor on PostgreSQL)"""
+    return db.query(models.Movie).order_by(models.Movie.id).yield_per(EXPORT_BATCH_SIZE)
+
+
+def iter_all_tv_shows(db: Session) -> Iterator[models.TVShow]:
+    """Stream every TV show in batches (through a server-side cursor on PostgreSQL)"""
+    return db.query(models.TVShow).order_by(models.TVShow.id).yield_per(EXPORT_BATCH_SIZE)
+
+
 def find_movie_by_title_and_director(db: Session, title: str, director: str) -> Optional[models.Movie]:
-    """Find a movie by title and director for import conflict resolution"""
-    return db.query(models.Movie).filter(
-        models.Movie.title == title,
-        models.Movie.director == director
-    ).first()
+    """
+    Find a movie by title and director for import conflict resolution.
+    Titles are compared in normalized form, falling back to a trigram
+    similarity match; directors must match ignoring case and accents.
+    """
+    director_key = title_index.normalize_name(director)
+    candidates = db.query(models.Movie).filter(
+        models.Movie.title_normalized == title_index.normalize_title(title)
+    ).all()
+    for movie in candidates:
+        if title_index.normalize_name(movie.director) == director_key:
+            return movie
+    # Only the director's own movies are candidates, however many similar titles others have
+    director_id = directors.find_id(db, director)
+    if director_key and director_id is None:
+        return None
+    same_director = models.Movie.director_id == director_id if director_id is not None else models.Movie.director_id.is_(None)
+    for movie, _ in title_index.find_similar(
+        db, models.Movie, title,
+        threshold=title_index.IMPORT_MATCH_THRESHOLD,
+        query_filter=same_director,
+        same_numbers=True,
+    ):
+        if title_index.normalize_name(movie.director) == director_key:
+            return movie
+    return None
 
 
 def find_tv_show_by_title_and_year(db: Session, title: str, year: int) -> Optional[models.TVShow]:
-    """Find a TV show by title and year for import conflict resolution"""
-    return db.query(models.TVShow).filter(
-        models.TVShow.title == title,
+    """
+    Find a TV show by title and year for import conflict resolution.
+    Titles are compared in normalized form, falling back to a trigram
+    similarity match with the same year.
+    """
+    existing = db.query(models.TVShow).filter(
+        models.TVShow.title_normalized == title_index.normalize_title(title),
         models.TVShow.year == year
     ).first()
-
-
-def import_movies(db: Session, movies: List[schemas.MovieCreate]) -> tuple[int, int, List[str]]:
+    if existing is not None:
+        return existing
+    matches = title_index.find_similar(
+        db, models.TVShow, title,
+        threshold=title_index.IMPORT_MATCH_THRESHOLD,
+        limit=1,
+        query_filter=models.TVShow.year == year,
+        same_numbers=True,
+    )
+    return matches[0][0] if matches else None
+
+
+def import_movies(db: Session, movies: List[schemas.MovieCreate], commit: bool = True) -> tuple[int, int, List[str]]:
     """Import movies, returning (created_count, updated_count, errors)"""
     created = 0
     updated = 0
@@ -173,6 +468,10 @@ def import_movies(db: Session, movies: List[schemas.MovieCreate]) -> tuple[int,
         except Exception as e:
             errors.append(f"Error importing movie '{movie_data.title}': {str(e)}")
     
+    if not commit:
+        db.flush()
+        return created, updated, errors
+
     try:
         db.commit()
     except Exception as e:
@@ -183,7 +482,7 @@ def import_movies(db: Session, movies: List[schemas.MovieCreate]) -> tuple[int,
     return created, updated, errors
 
 
-def import_tv_shows(db: Session, tv_shows: List[schemas.TVShowCreate]) -> tuple[int, int, List[str]]:
+def import_tv_shows(db: Session, tv_shows: List[schemas.TVShowCreate], commit: bool = True) -> tuple[int, int, List[str]]:
     """Import TV shows, returning (created_count, updated_count, errors)"""
     created = 0
     updated = 0
@@ -209,6 +508,10 @@ def import_tv_shows(db: Session, tv_shows: List[schemas.TVShowCreate]) -> tuple[
         except Exception as e:
             errors.append(f"Error importing TV show '{tv_show_data.title}': {str(e)}")
     
+    if not commit:
+        db.flush()
+        return created, updated, errors
+
     try:
         db.commit()
     except Exception as e:
@@ -341,29 +644,32 @@ def get_year_statistics(db: Session) -> dict:
 
 
 def get_director_statistics(db: Session) -> dict:
-    """Get statistics by director/creator"""
+    """Get statistics by director/creator, from the per-director aggregates"""
     # Top directors
     director_counts = db.query(
-        models.Movie.director, 
-        func.count(models.Movie.id).label('count')
-    ).group_by(models.Movie.director).order_by(func.count(models.Movie.id).desc()).limit(10).all()
-    
-    # Directors with highest average ratings
+        models.Director.name,
+        models.Director.movie_count
+    ).filter(models.Director.movie_count > 0).order_by(
+        models.Director.movie_count.desc(), models.Director.name
+    ).limit(10).all()
+
+    # Directors with highest average ratings (served by the ix_directors_avg_rating index)
+    avg_rating = literal_column(directors.AVG_RATING)
     director_ratings = db.query(
-        models.Movie.director,
-        func.avg(models.Movie.rating).label('avg_rating'),
-        func.count(models.Movie.id).label('count')
+        models.Director.name,
+        avg_rating.label('avg_rating'),
+        models.Director.rated_count
     ).filter(
-        models.Movie.rating.isnot(None)
-    ).group_by(models.Movie.director).order_by(
-        func.avg(models.Movie.rating).desc(),
-        func.count(models.Movie.id).desc()  # Secondary sort by movie count for ties
+        models.Director.rated_count > 0
+    ).order_by(
+        avg_rating.desc(),
+        models.Director.rated_count.desc()  # Secondary sort by movie count for ties
     ).limit(10).all()
-    
+
     return {
         "top_directors": [{"director": d[0], "count": d[1]} for d in director_counts],
         "highest_rated_directors": [
-            {"director": d[0], "avg_rating": round(d[1], 1), "count": d[2]} 
+            {"director": d[0], "avg_rating": round(d[1], 1), "count": d[2]}
             for d in director_ratings
         ]
-    }
\ No newline at end of file
+    }
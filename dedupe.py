@@ -0,0 +1,271 @@
+"""
+Duplicate detection and merging for the StreamTracker API.
+
+Candidate pairs are generated by blocking: rows are streamed in the order
+ of a blocking key (normalized title prefix plus year or director) and
+ only rows within the same block, and within a small sorted window of each
+ other, are compared. This keeps the work near-linear in the catalog size
+ instead of comparing all pairs. Matching pairs are grouped with
+ union-find, and each group is split into complete-link clusters, in which
+ every two items match, so that A ~ B and B ~ C never put A and C together
+ on their own. Merges keep the most complete data of each cluster.
+"""
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+import title_index
+
+MOVIE = "movie"
+TV_SHOW = "tv_show"
+
+# Minimum pair score for two items to be considered duplicates
+DEFAULT_MIN_SCORE = 0.7
+# Length of the normalized title prefix used in the blocking keys
+PREFIX_LENGTH = 4
+# Each row is compared with this many following rows of its block (sorted by title)
+WINDOW = 10
+# Clusters merged per transaction
+MERGE_BATCH_SIZE = 200
+
+_MODELS = {MOVIE: models.Movie, TV_SHOW: models.TVShow}
+
+
+class ClusterChanged(ValueError):
+    """Raised when a cluster selected for merging no longer holds the items that were reviewed"""
+
+
+def _blocking_passes(model) -> List[list]:
+    """Blocking keys for a model: each pass groups rows sharing all the key expressions"""
+    prefix = func.substr(model.title_normalized, 1, PREFIX_LENGTH)
+    if model is models.Movie:
+        director = func.lower(model.director)
+        return [[prefix, model.year], [prefix, director], [director, model.year]]
+    return [[prefix, model.year]]
+
+
+def _features(row) -> tuple:
+    """Precompute what pair scoring needs for a row: (id, year, trigrams, numbers, director)"""
+    normalized = row.title_normalized or ""
+    numbers = title_index.title_numbers(normalized)
+    director = title_index.normalize_name(row.director) if hasattr(row, "director") else None
+    return row.id, row.year, title_index.title_trigrams(normalized), numbers, director
+
+
+def _pair_score(model, a: tuple, b: tuple) -> float:
+    """
+    Weighted similarity of two rows (as returned by _features), from 0.0 to
+    1.0. Rows more than a year apart, whose titles carry different numbers
+    ("Godfather" vs "Godfather II"), or movies by two different directors
+    (as import matching requires) are never considered duplicates.
+    """
+    _, year_a, trigrams_a, numbers_a, director_a = a
+    _, year_b, trigrams_b, numbers_b, director_b = b
+    if year_a is not None and year_b is not None and abs(year_a - year_b) > 1:
+        return 0.0
+    if numbers_a != numbers_b or not trigrams_a or not trigrams_b:
+        return 0.0
+    shared = len(trigrams_a & trigrams_b)
+    title_score = shared / (len(trigrams_a) + len(trigrams_b) - shared)
+    year_score = 1.0 if year_a == year_b else 0.5
+    if model is models.Movie:
+        if director_a and director_b and director_a != director_b:
+            return 0.0
+        # A director missing on either side is no evidence either way
+        director_score = 1.0 if director_a and director_a == director_b else 0.0
+        return 0.6 * title_score + 0.25 * director_score + 0.15 * year_score
+    return 0.7 * title_score + 0.3 * year_score
+
+
+def _candidate_pairs(db: Session, model, min_score: float) -> Tuple[Dict[tuple, float], Dict[int, tuple]]:
+    """
+    Score candidate pairs from every blocking pass, keeping those above
+    min_score. Also returns the features of the rows in those pairs, by id.
+    """
+    columns = [model.id, model.title_normalized, model.year]
+    if model is models.Movie:
+        columns.append(model.director)
+    pairs = {}
+    features = {}
+    for keys in _blocking_passes(model):
+        labeled = [key.label(f"block_{i}") for i, key in enumerate(keys)]
+        query = db.query(*columns, *labeled).order_by(*keys, model.title_normalized).yield_per(1000)
+        for block_key, block in groupby(query, key=lambda row: tuple(row[len(columns):])):
+            if any(part is None or part == "" for part in block_key):
+                continue
+            rows = list(block)
+            if len(rows) < 2:
+                continue
+            rows = [_features(row) for row in rows]
+            for i, row in enumerate(rows):
+                for other in rows[i + 1:i + 1 + WINDOW]:
+                    pair = (min(row[0], other[0]), max(row[0], other[0]))
+                    if pair in pairs:
+                        continue
+                    score = _pair_score(model, row, other)
+                    if score >= min_score:
+                        pairs[pair] = score
+                        features[row[0]] = row
+                        features[other[0]] = other
+    return pairs, features
+
+
+def _complete_link(model, group_pairs: List[tuple], features: Dict[int, tuple], min_score: float) -> List[dict]:
+    """
+    Split a group of items connected by matching (pair, score) entries into
+    clusters in which every two items match, joining the best matching
+    pairs first. Pairs the blocking passes never compared are scored here.
+    """
+    scores = dict(group_pairs)
+
+    def matches(a, b):
+        pair = (min(a, b), max(a, b))
+        if pair not in scores:
+            scores[pair] = _pair_score(model, features[a], features[b])
+        return scores[pair] >= min_score
+
+    members = {}
+    owner = {}
+    for (a, b), _ in group_pairs:
+        for item_id in (a, b):
+            members.setdefault(item_id, [item_id])
+            owner.setdefault(item_id, item_id)
+    for (a, b), _ in sorted(group_pairs, key=lambda entry: (-entry[1], entry[0])):
+        root_a, root_b = owner[a], owner[b]
+        if root_a == root_b or not all(matches(x, y) for x in members[root_a] for y in members[root_b]):
+            continue
+        root, other = min(root_a, root_b), max(root_a, root_b)
+        for item_id in members[other]:
+            owner[item_id] = root
+        members[root].extend(members.pop(other))
+    clusters = []
+    for root, item_ids in members.items():
+        if len(item_ids) > 1:
+            item_ids.sort()
+            lowest = min(scores[(x, y)] for i, x in enumerate(item_ids) for y in item_ids[i + 1:])
+            clusters.append({"item_ids": item_ids, "score": round(lowest, 3)})
+    return clusters
+
+
+def _cluster(model, pairs: Dict[tuple, float], features: Dict[int, tuple], min_score: float) -> List[dict]:
+    """Group matching pairs with union-find, then split each group into complete-link clusters"""
+    parent = {}
+
+    def find(item_id):
+        parent.setdefault(item_id, item_id)
+        while parent[item_id] != item_id:
+            parent[item_id] = parent[parent[item_id]]
+            item_id = parent[item_id]
+        return item_id
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for pair, score in pairs.items():
+        groups.setdefault(find(pair[0]), []).append((pair, score))
+    clusters = []
+    for group_pairs in groups.values():
+        clusters.extend(_complete_link(model, group_pairs, features, min_score))
+    return sorted(clusters, key=lambda cluster: cluster["item_ids"][0])
+
+
+def find_duplicate_clusters(
+    db: Session,
+    item_type: str,
+    min_score: float = DEFAULT_MIN_SCORE,
+) -> List[dict]:
+    """
+    Find clusters of likely duplicates of one item type. Each cluster has a
+    stable id ("<type>-<id of the row that will be kept>"), the ids of its
+    items (kept row first) and the lowest score among all its pairs.
+    """
+    model = _MODELS[item_type]
+    pairs, features = _candidate_pairs(db, model, min_score)
+    clusters = _cluster(model, pairs, features, min_score)
+    for cluster in clusters:
+        cluster["type"] = item_type
+        cluster["keep_id"] = cluster["item_ids"][0]
+        cluster["id"] = f"{item_type}-{cluster['keep_id']}"
+    return clusters
+
+
+def load_cluster_items(db: Session, item_type: str, clusters: List[dict]) -> Dict[int, object]:
+    """Load the rows referenced by a list of clusters, keyed by id"""
+    model = _MODELS[item_type]
+    ids = [item_id for cluster in clusters for item_id in cluster["item_ids"]]
+    rows = {}
+    for start in range(0, len(ids), 500):
+        for row in db.query(model).filter(model.id.in_(ids[start:start + 500])):
+            rows[row.id] = row
+    return rows
+
+
+def _merge_into(keep, duplicates) -> None:
+    """Copy the most complete data of a cluster onto the row being kept"""
+    rows = [keep] + duplicates
+    ratings = [row.rating for row in rows if row.rating is not None]
+    if ratings:
+        keep.rating = max(ratings)
+    reviews = [row.review for row in rows if row.review]
+    if reviews:
+        keep.review = max(reviews, key=len)
+    if not keep.poster_url:
+        keep.poster_url = next((row.poster_url for row in duplicates if row.poster_url), None)
+    keep.watched = any(row.watched for row in rows)
+    if isinstance(keep, models.TVShow):
+        for field in ("seasons", "episodes"):
+            values = [getattr(row, field) for row in rows if getattr(row, field) is not None]
+            if values:
+                setattr(keep, field, max(values))
+
+
+def merge_duplicates(
+    db: Session,
+    item_type: str,
+    reviewed: Optional[Dict[str, List[int]]] = None,
+    min_score: float = DEFAULT_MIN_SCORE,
+) -> dict:
+    """
+    Merge duplicate clusters of one item type: all of them, or only those in
+    `reviewed`, which maps cluster ids to the item ids the client was shown.
+    ClusterChanged is raised, before anything is merged, if one of those
+    clusters is gone or no longer has exactly these items. The lowest id of
+    each cluster is kept and receives the highest rating, longest review, a
+    poster and the watched flag of the others; the rest are deleted.
+    Clusters are merged in batches, one transaction per batch.
+    """
+    clusters = find_duplicate_clusters(db, item_type, min_score=min_score)
+    if reviewed is not None:
+        current = {cluster["id"]: cluster for cluster in clusters}
+        for cluster_id, item_ids in reviewed.items():
+            if cluster_id not in current or current[cluster_id]["item_ids"] != sorted(item_ids):
+                raise ClusterChanged(f"Duplicate cluster '{cluster_id}' has changed since it was listed")
+        clusters = [current[cluster_id] for cluster_id in sorted(reviewed, key=lambda c: current[c]["keep_id"])]
+
+    merged = 0
+    removed = 0
+    for start in range(0, len(clusters), MERGE_BATCH_SIZE):
+        batch = clusters[start:start + MERGE_BATCH_SIZE]
+        rows = load_cluster_items(db, item_type, batch)
+        try:
+            for cluster in batch:
+                keep = rows.get(cluster["keep_id"])
+                duplicates = [rows[i] for i in cluster["item_ids"][1:] if i in rows]
+                if keep is None or not duplicates:
+                    continue
+                _merge_into(keep, duplicates)
+                for duplicate in duplicates:
+                    db.delete(duplicate)
+                merged += 1
+                removed += len(duplicates)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return {"clusters_merged": merged, "items_removed": removed}
@@ -0,0 +1,125 @@
+"""
+Director dimension for the StreamTracker API.
+
+Movies reference a row of the directors table through director_id, and
+ every spelling of a name that normalizes the same way ("Denis Villeneuve",
+ "denis villeneuve", "Dénis Villeneuve") shares one director. Each director
+ keeps its movie count, rated movie count and rating sum, updated by mapper
+ events in the same transaction as the movie write, so director statistics
+ and filters read the directors table through its indexes instead of
+ grouping every movie. Movies keep their own spelling in movies.director,
+ which is what the API accepts and returns.
+"""
+from typing import Optional
+
+from sqlalchemy import event, inspect, text
+
+import models
+import title_index
+
+# Average rating expression, spelled exactly as in the ix_directors_avg_rating index
+AVG_RATING = "(rating_sum / rated_count)"
+
+_SELECT_ID = text("SELECT id FROM directors WHERE name_key = :key")
+# ON CONFLICT: another process may add the same director concurrently
+_INSERT = text(
+    "INSERT INTO directors (name, name_key, movie_count, rated_count, rating_sum) "
+    "VALUES (:name, :key, 0, 0, 0) ON CONFLICT (name_key) DO NOTHING"
+)
+_ADJUST = text(
+    "UPDATE directors SET movie_count = movie_count + :movies, rated_count = rated_count + :rated, "
+    "rating_sum = rating_sum + :rating WHERE id = :id"
+)
+_STORED = text("SELECT director_id, rating FROM movies WHERE id = :id")
+_RECOUNT = text(
+    "UPDATE directors SET "
+    "movie_count = (SELECT count(*) FROM movies WHERE movies.director_id = directors.id), "
+    "rated_count = (SELECT count(rating) FROM movies WHERE movies.director_id = directors.id), "
+    "rating_sum = (SELECT coalesce(sum(rating), 0) FROM movies WHERE movies.director_id = directors.id)"
+)
+
+
+def director_key(name: Optional[str]) -> str:
+    """Key identifying a director: the name ignoring case, accents and punctuation"""
+    return title_index.normalize_name(name)
+
+
+def resolve_id(conn, name: Optional[str]) -> Optional[int]:
+    """Id of the director called `name`, adding the director if needed (None for no name)"""
+    key = director_key(name)
+    if not key:
+        return None
+    director_id = conn.execute(_SELECT_ID, {"key": key}).scalar()
+    if director_id is None:
+        conn.execute(_INSERT, {"name": name.strip(), "key": key})
+        director_id = conn.execute(_SELECT_ID, {"key": key}).scalar()
+    return director_id
+
+
+def find_id(db, name: Optional[str]) -> Optional[int]:
+    """Id of an existing director called `name`, or None"""
+    key = director_key(name)
+    return db.execute(_SELECT_ID, {"key": key}).scalar() if key else None
+
+
+def _adjust(conn, director_id: Optional[int], rating: Optional[float], sign: int) -> None:
+    if director_id is None:
+        return
+    conn.execute(_ADJUST, {
+        "id": director_id,
+        "movies": sign,
+        "rated": sign if rating is not None else 0,
+        "rating": sign * rating if rating is not None else 0,
+    })
+
+
+def _movie_inserted(mapper, connection, target):
+    target.director_id = resolve_id(connection, target.director)
+    _adjust(connection, target.director_id, target.rating, 1)
+
+
+def _movie_updated(mapper, connection, target):
+    state = inspect(target).attrs
+    if not state.director.history.has_changes() and not state.rating.history.has_changes():
+        return
+    # The stored row still holds the old values, whatever the session has loaded
+    stored = connection.execute(_STORED, {"id": target.id}).one()
+    target.director_id = resolve_id(connection, target.director)
+    _adjust(connection, stored.director_id, stored.rating, -1)
+    _adjust(connection, target.director_id, target.rating, 1)
+
+
+def _movie_deleted(mapper, connection, target):
+    stored = connection.execute(_STORED, {"id": target.id}).one_or_none()
+    if stored is not None:
+        _adjust(connection, stored.director_id, stored.rating, -1)
+
+
+event.listen(models.Movie, "before_insert", _movie_inserted)
+event.listen(models.Movie, "before_update", _movie_updated)
+event.listen(models.Movie, "before_delete", _movie_deleted)
+
+
+def backfill_directors(conn, rebuild: bool = False) -> int:
+    """
+    Link movies written before the directors table existed, or by raw SQL,
+    to their director (every movie when rebuild=True), then recount the
+    aggregates if anything changed. Returns the number of movies linked.
+    """
+    condition = "" if rebuild else " WHERE director_id IS NULL AND director IS NOT NULL"
+    rows = conn.execute(text(f"SELECT id, director FROM movies{condition}")).all()
+    ids = {}
+    links = []
+    for row in rows:
+        key = director_key(row.director)
+        if key and key not in ids:
+            ids[key] = resolve_id(conn, row.director)
+        # Names without a key (blank or punctuation only) stay unlinked
+        if key or rebuild:
+            links.append({"id": row.id, "director_id": ids.get(key)})
+    if not links and not rebuild:
+        return 0
+    if links:
+        conn.execute(text("UPDATE movies SET director_id = :director_id WHERE id = :id"), links)
+    conn.execute(_RECOUNT)
+    return len(links)
@@ -0,0 +1,127 @@
+"""
+In-process change feed for the StreamTracker API.
+
+Committed writes are published to a ChangeBroker, which fans them out to
+ the subscribers of the /events Server-Sent Events stream. Every
+ subscriber has a bounded queue. Publishing never waits on a subscriber:
+ when a queue is full, its pending events are dropped and replaced by a
+ single "resync" event, telling that client to catch up through /sync.
+ Subscribers follow one catalog (None is the default catalog) and only
+ receive the events published for it.
+"""
+import asyncio
+import json
+import threading
+from typing import List, Optional
+
+# Events buffered per subscriber before it is told to resync
+QUEUE_SIZE = 256
+# Commits touching more items than this are announced as a resync instead
+MAX_BATCH_EVENTS = 100
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Upper bound on concurrent subscribers per worker process
+MAX_SUBSCRIBERS = 1000
+
+
+class TooManySubscribers(RuntimeError):
+    """Raised when the broker already has MAX_SUBSCRIBERS subscribers"""
+
+
+class Subscriber:
+    """A single /events client with its bounded event queue"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, catalog: Optional[str] = None):
+        self.loop = loop
+        self.catalog = catalog
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def offer(self, events: List[dict]) -> None:
+        """Queue events without blocking; on overflow collapse the backlog into a resync"""
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait({"event": "resync", "seq": events[-1].get("seq")})
+                return
+
+
+class ChangeBroker:
+    """Fan-out of change events to subscribers; safe to publish from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: set = set()
+
+    def subscribe(self, catalog: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), catalog)
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers("Too many event stream subscribers")
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def has_subscribers(self, catalog: Optional[str] = None) -> bool:
+        with self._lock:
+            return any(subscriber.catalog == catalog for subscriber in self._subscribers)
+
+    def publish(self, events: List[dict], catalog: Optional[str] = None) -> None:
+        """Publish the events of one commit to every subscriber of its catalog"""
+        if not events:
+            return
+        if len(events) > MAX_BATCH_EVENTS:
+            events = [{"event": "resync", "seq": max(event["seq"] for event in events)}]
+        with self._lock:
+            subscribers = [subscriber for subscriber in self._subscribers if subscriber.catalog == catalog]
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, events)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                self.unsubscribe(subscriber)
+
+
+broker = ChangeBroker()
+
+
+def format_sse(event: dict) -> str:
+    """Serialize an event as a Server-Sent Events message"""
+    name = event.get("event", "change")
+    data = {key: value for key, value in event.items() if key != "event"}
+    lines = []
+    if event.get("seq") is not None:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {name}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(token: Optional[str] = None, catalog: Optional[str] = None):
+    """Async generator producing the SSE stream of one subscriber"""
+    try:
+        subscriber = broker.subscribe(catalog)
+    except TooManySubscribers:
+        return
+    try:
+        yield "retry: 3000\n\n"
+        yield format_sse({"event": "ready", "token": token})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,462 @@
+"""
+Background jobs for the StreamTracker API.
+
+Long-running imports, exports and index rebuilds are submitted as jobs
+ and run on a small bounded worker pool instead of inside the HTTP
+ request. Job state lives in the jobs table and job payloads in files next
+ to the database. An import commits its progress together with each chunk
+ of rows, so a job that was running when the server stopped resumes where
+ it left off. Each job records the worker process that owns it, which
+ refreshes the job's heartbeat while it is queued or running. Every worker
+ periodically takes over the jobs whose heartbeat has gone stale, so the
+ jobs of a worker that died (or of the server before a restart) carry on
+ in another one. Each catalog keeps its own jobs table, so a tenant's jobs
+ run against (and are only visible in) that tenant's catalog; they are
+ taken over when a worker opens the catalog and while it stays open.
+"""
+import json
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import crud
+import directors
+import models
+import schemas
+import search_index
+import tenants
+import title_index
+from database import IS_SQLITE, Catalog, db_path, default_catalog
+
+JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(db_path)), "jobs")
+# Worker threads running jobs
+MAX_WORKERS = int(os.environ.get("STREAMTRACKER_JOB_WORKERS", "2"))
+# Jobs waiting or running at once; further submissions are rejected
+MAX_PENDING_JOBS = 20
+# Rows imported or exported per transaction / progress update
+CHUNK_SIZE = 500
+# Error messages kept per job (the count keeps going)
+MAX_ERRORS_KEPT = 100
+# Seconds between the heartbeats of the jobs a worker owns (and its checks for stale jobs)
+HEARTBEAT_INTERVAL = float(os.environ.get("STREAMTRACKER_JOB_HEARTBEAT_SECONDS", "10"))
+# Jobs without a heartbeat for this many seconds are taken over by another worker
+HEARTBEAT_TIMEOUT = 6 * HEARTBEAT_INTERVAL
+# Owner recorded on the jobs this worker process queues and runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+IMPORT = "import"
+EXPORT = "export"
+REBUILD = "rebuild"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when MAX_PENDING_JOBS jobs are already waiting or running"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when its cancellation has been requested"""
+
+
+class JobReclaimed(Exception):
+    """Raised inside a job when another worker has taken it over"""
+
+
+def _payload_path(job_id: str) -> str:
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+
+def _remove_payload(job_id: str) -> None:
+    if os.path.exists(_payload_path(job_id)):
+        os.remove(_payload_path(job_id))
+
+
+def result_path(job_id: str) -> str:
+    return os.path.join(JOB_DIR, f"{job_id}-result.json")
+
+
+class JobContext:
+    """Progress reporting and cancellation checks for a running job"""
+
+    def __init__(self, catalog: Catalog, db: Session, job: models.Job):
+        self.catalog = catalog
+        self.db = db
+        self.job = job
+
+    def check_owner(self) -> None:
+        self.db.refresh(self.job, attribute_names=["owner"])
+        if self.job.owner != WORKER_ID:
+            raise JobReclaimed()
+
+    def check_cancelled(self) -> None:
+        self.db.refresh(self.job, attribute_names=["cancel_requested", "owner"])
+        if self.job.owner != WORKER_ID:
+            raise JobReclaimed()
+        if self.job.cancel_requested:
+            raise JobCancelled()
+
+    def add_errors(self, errors: List[str]) -> None:
+        if not errors:
+            return
+        kept = json.loads(self.job.errors or "[]")
+        kept.extend(errors[:max(0, MAX_ERRORS_KEPT - len(kept))])
+        self.job.errors = json.dumps(kept)
+        self.job.error_count = (self.job.error_count or 0) + len(errors)
+
+
+def _chunks(items: list, start: int) -> Iterator[tuple]:
+    for offset in range(start, len(items), CHUNK_SIZE):
+        yield offset, items[offset:offset + CHUNK_SIZE]
+
+
+def _parse_rows(rows: list, schema, label: str, errors: List[str]) -> list:
+    parsed = []
+    for row in rows:
+        try:
+            parsed.append(schema(**row))
+        except Exception as e:
+            errors.append(f"Invalid {label} {row.get('title', '?') if isinstance(row, dict) else '?'}: {e}")
+    return parsed
+
+
+def _run_import(ctx: JobContext) -> dict:
+    with open(_payload_path(ctx.job.id), encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or "movies" not in data or "tv_shows" not in data:
+        raise ValueError("Invalid file format. Expected 'movies' and 'tv_shows' arrays.")
+    movies, tv_shows = data.get("movies") or [], data.get("tv_shows") or []
+    ctx.job.total_rows = len(movies) + len(tv_shows)
+    result = json.loads(ctx.job.result or "{}") or {
+        "movies_created": 0, "movies_updated": 0, "tv_shows_created": 0, "tv_shows_updated": 0,
+    }
+
+    # Rows already committed by an earlier run of this job are skipped
+    done = ctx.job.processed_rows or 0
+    for kind, rows, offset_base in (("movies", movies, 0), ("tv_shows", tv_shows, len(movies))):
+        schema = schemas.MovieCreate if kind == "movies" else schemas.TVShowCreate
+        importer = crud.import_movies if kind == "movies" else crud.import_tv_shows
+        for offset, chunk in _chunks(rows, max(0, done - offset_base)):
+            ctx.check_cancelled()
+            errors: List[str] = []
+            parsed = _parse_rows(chunk, schema, kind[:-1].replace("_", " "), errors)
+            try:
+                created, updated, import_errors = importer(ctx.db, parsed, commit=False)
+            except Exception as e:
+                ctx.db.rollback()
+                created, updated, import_errors = 0, 0, [f"Database error during {kind} import: {e}"]
+            errors.extend(import_errors)
+            result[f"{kind}_created"] += created
+            result[f"{kind}_updated"] += updated
+            # Progress is committed in the same transaction as the rows themselves
+            ctx.job.processed_rows = offset_base + offset + len(chunk)
+            ctx.job.result = json.dumps(result)
+            ctx.add_errors(errors)
+            ctx.db.commit()
+    return result
+
+
+def _run_export(ctx: JobContext) -> dict:
+    db = ctx.db
+    ctx.job.total_rows = db.query(models.Movie).count() + db.query(models.TVShow).count()
+    ctx.db.commit()
+    counts = {"total_movies": 0, "total_tv_shows": 0}
+    os.makedirs(JOB_DIR, exist_ok=True)
+    partial = result_path(ctx.job.id) + ".partial"
+    # Rows are streamed on their own session: the progress commits on ctx.db
+    # would otherwise close the server-side cursor on PostgreSQL
+    stream_db = ctx.catalog.SessionLocal()
+    try:
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write('{"export_metadata": ')
+            f.write(json.dumps({"export_timestamp": datetime.now().isoformat(), "version": "1.0"}))
+            for key, rows, schema, count_key in (
+                ("movies", crud.iter_all_movies(stream_db), schemas.Movie, "total_movies"),
+                ("tv_shows", crud.iter_all_tv_shows(stream_db), schemas.TVShow, "total_tv_shows"),
+            ):
+                f.write(f', "{key}": [')
+                for row in rows:
+                    if counts[count_key]:
+                        f.write(",")
+                    f.write(schema.model_validate(row).model_dump_json())
+                    counts[count_key] += 1
+                    written = counts["total_movies"] + counts["total_tv_shows"]
+                    if written % CHUNK_SIZE == 0:
+                        ctx.job.processed_rows = written
+                        ctx.db.commit()
+                        ctx.check_cancelled()
+                f.write("]")
+            f.write("}")
+    except Exception:
+        # Cancelled or failed: no result will ever be served from it
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        stream_db.close()
+    ctx.job.processed_rows = counts["total_movies"] + counts["total_tv_shows"]
+    os.replace(partial, result_path(ctx.job.id))
+    return counts
+
+
+def _run_rebuild(ctx: JobContext) -> dict:
+    ctx.job.total_rows = 3
+    ctx.db.commit()
+    if IS_SQLITE:
+        # PostgreSQL keeps its trigram search indexes up to date itself
+        with ctx.catalog.engine.connect() as conn:
+            search_index.rebuild_search_index(conn)
+            conn.commit()
+    ctx.job.processed_rows = 1
+    ctx.db.commit()
+    ctx.check_cancelled()
+    with ctx.catalog.engine.connect() as conn:
+        indexed = title_index.backfill_title_index(conn, rebuild=True)
+        conn.commit()
+    ctx.job.processed_rows = 2
+    ctx.db.commit()
+    ctx.check_cancelled()
+    with ctx.catalog.engine.connect() as conn:
+        linked = directors.backfill_directors(conn, rebuild=True)
+        conn.commit()
+    ctx.job.processed_rows = 3
+    return {"titles_indexed": indexed, "movies_linked_to_directors": linked}
+
+
+_RUNNERS = {IMPORT: _run_import, EXPORT: _run_export, REBUILD: _run_rebuild}
+
+
+class JobManager:
+    """Bounded worker pool running persisted jobs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Jobs this worker has queued or is running, with their catalog
+        self._pending: Dict[str, Optional[str]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _submit(self, catalog: Optional[str], job_id: str) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+            self._pending[job_id] = catalog
+            self._executor.submit(self._run, catalog, job_id)
+
+    def create(self, db: Session, kind: str, payload: Optional[bytes] = None) -> models.Job:
+        """Persist a new job (and its payload) in the session's catalog and queue it"""
+        with self._lock:
+            if len(self._pending) >= MAX_PENDING_JOBS:
+                raise JobQueueFull("Too many jobs are already queued or running")
+        now = datetime.utcnow()
+        job = models.Job(
+            id=uuid.uuid4().hex, kind=kind, status=QUEUED, created_at=now,
+            total_rows=0, processed_rows=0, error_count=0, cancel_requested=False,
+            owner=WORKER_ID, heartbeat_at=now,
+        )
+        if payload is not None:
+            os.makedirs(JOB_DIR, exist_ok=True)
+            with open(_payload_path(job.id), "wb") as f:
+                f.write(payload)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._submit(db.info.get("catalog"), job.id)
+        return job
+
+    def cancel(self, db: Session, job_id: str) -> Optional[models.Job]:
+        """Request cancellation; queued jobs are cancelled right away, running ones at the next chunk"""
+        job = get_job(db, job_id)
+        if job is None:
+            return None
+        if job.status not in FINISHED_STATES:
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = datetime.utcnow()
+            db.commit()
+            db.refresh(job)
+        return job
+
+    def start(self) -> None:
+        """Start sending heartbeats and taking over stale jobs (in every worker process)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._maintain, name="job-heartbeat", daemon=True)
+            self._thread.start()
+
+    def _maintain(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.heartbeat()
+                for name in [None] + tenants.catalogs.open_names():
+                    catalog = tenants.catalogs.acquire(name)
+                    try:
+                        self.reclaim(catalog)
+                    finally:
+                        tenants.catalogs.release(catalog)
+            except Exception as e:
+                print(f"Job heartbeat warning: {e}")
+            self._stop.wait(HEARTBEAT_INTERVAL)
+
+    def heartbeat(self) -> None:
+        """Refresh the heartbeat of every job this worker has queued or is running"""
+        self._set_heartbeat(datetime.utcnow())
+
+    def _set_heartbeat(self, heartbeat_at: Optional[datetime]) -> None:
+        with self._lock:
+            by_catalog: Dict[Optional[str], List[str]] = {}
+            for job_id, catalog_name in self._pending.items():
+                by_catalog.setdefault(catalog_name, []).append(job_id)
+        for catalog_name, job_ids in by_catalog.items():
+            catalog = tenants.catalogs.acquire(catalog_name)
+            db = catalog.SessionLocal()
+            try:
+                db.query(models.Job).filter(
+                    models.Job.id.in_(job_ids), models.Job.owner == WORKER_ID,
+                    models.Job.status.in_([QUEUED, RUNNING]),
+                ).update({models.Job.heartbeat_at: heartbeat_at}, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+                tenants.catalogs.release(catalog)
+
+    def reclaim(self, catalog: Catalog = default_catalog) -> int:
+        """Take over and queue a catalog's unfinished jobs whose owner has stopped sending heartbeats"""
+        cutoff = datetime.utcnow() - timedelta(seconds=HEARTBEAT_TIMEOUT)
+        stale = (
+            models.Job.status.in_([QUEUED, RUNNING]),
+            or_(models.Job.heartbeat_at.is_(None), models.Job.heartbeat_at < cutoff),
+        )
+        with self._lock:
+            own = set(self._pending)
+        db = catalog.SessionLocal()
+        try:
+            reclaimed = []
+            for (job_id,) in db.query(models.Job.id).filter(*stale).all():
+                if job_id in own:
+                    continue
+                # Conditional, so only one worker takes a stale job over
+                taken = db.query(models.Job).filter(models.Job.id == job_id, *stale).update(
+                    {models.Job.status: QUEUED, models.Job.owner: WORKER_ID, models.Job.heartbeat_at: datetime.utcnow()},
+                    synchronize_session=False,
+                )
+                db.commit()
+                if taken:
+                    reclaimed.append(job_id)
+        finally:
+            db.close()
+        for job_id in reclaimed:
+            self._submit(catalog.name, job_id)
+        return len(reclaimed)
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            # Unfinished jobs lose their heartbeat, so the next worker takes them over right away
+            self._set_heartbeat(None)
+        except Exception as e:
+            print(f"Job heartbeat warning: {e}")
+
+    def _run(self, catalog_name: Optional[str], job_id: str) -> None:
+        try:
+            catalog = tenants.catalogs.acquire(catalog_name)
+            try:
+                self._execute(catalog, job_id)
+            finally:
+                tenants.catalogs.release(catalog)
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def _execute(self, catalog: Catalog, job_id: str) -> None:
+        db = catalog.SessionLocal()
+        try:
+            # Claimed with a conditional update, so only the job's owner runs it
+            claimed = db.query(models.Job).filter(
+                models.Job.id == job_id, models.Job.status == QUEUED, models.Job.owner == WORKER_ID
+            ).update({models.Job.status: RUNNING, models.Job.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            job = get_job(db, job_id)
+            if not claimed:
+                if job is None or job.status in FINISHED_STATES:
+                    _remove_payload(job_id)
+                return
+            job.started_at = job.started_at or datetime.utcnow()
+            db.commit()
+            ctx = JobContext(catalog, db, job)
+            try:
+                result = _RUNNERS[job.kind](ctx)
+                ctx.check_owner()
+                job.status = SUCCEEDED
+                job.result = json.dumps(result)
+            except JobCancelled:
+                db.rollback()
+                job.status = CANCELLED
+            except JobReclaimed:
+                # Another worker carries on from the last committed chunk
+                db.rollback()
+                return
+            except Exception as e:
+                db.rollback()
+                job.status = FAILED
+                ctx.add_errors([f"Job failed: {e}"])
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            _remove_payload(job_id)
+        finally:
+            db.close()
+
+
+manager = JobManager()
+
+
+def get_job(db: Session, job_id: str) -> Optional[models.Job]:
+    return db.get(models.Job, job_id)
+
+
+def list_jobs(db: Session, limit: int = 20) -> List[models.Job]:
+    return db.query(models.Job).order_by(models.Job.created_at.desc()).limit(limit).all()
+
+
+def describe(job: models.Job) -> dict:
+    """Job fields for the API, including throughput"""
+    end = job.finished_at or datetime.utcnow()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "total_rows": job.total_rows or 0,
+        "processed_rows": job.processed_rows or 0,
+        "error_count": job.error_count or 0,
+        "errors": json.loads(job.errors or "[]"),
+        "rows_per_second": round((job.processed_rows or 0) / elapsed, 1) if elapsed > 0 else None,
+        "result": json.loads(job.result) if job.result and job.status == SUCCEEDED else None,
+        "cancel_requested": bool(job.cancel_requested),
+    }
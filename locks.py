@@ -0,0 +1,88 @@
+"""
+Inter-process locks for running the StreamTracker API with several workers.
+
+A ProcessLock is a lock file next to the database, held with flock on
+ POSIX and msvcrt.locking on Windows, combined with a thread lock so it
+ also excludes other threads of the same process. The operating system
+ releases it if the holding process dies.
+"""
+import os
+import sys
+import threading
+import time
+
+from database import db_path
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# How often a blocking acquire retries on Windows, which has no blocking lock call without a timeout
+_RETRY_INTERVAL = 0.05
+
+
+def lock_path(name: str, database: str = db_path) -> str:
+    """Path of the lock file called `name` next to a database file"""
+    return f"{os.path.abspath(database)}.{name}.lock"
+
+
+class ProcessLock:
+    """Lock shared by every process using the same database"""
+
+    def __init__(self, name: str, database: str = db_path):
+        self.path = lock_path(name, database)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def _lock_file(self, blocking: bool) -> bool:
+        while True:
+            try:
+                if sys.platform == "win32":
+                    msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(_RETRY_INTERVAL)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if self._lock_file(blocking):
+                return True
+            os.close(self._fd)
+            self._fd = None
+        except BaseException:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            raise
+        self._thread_lock.release()
+        return False
+
+    def release(self) -> None:
+        if sys.platform == "win32":
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+        self._thread_lock.release()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def __enter__(self) -> "ProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
@@ -2,93 +2,121 @@
 Entry point for the StreamTracker API.
 Provides CRUD endpoints for managing movies and TV shows.
 """
-from typing import List, Optional
+if __name__ == "__main__":
+    # Bind the port and start the browser before the imports below; the
+    # launcher then loads this file again as the `main` module
+    import startup
+
+    startup.run_server()
+    raise SystemExit
+
+from typing import List, Optional, Union
+from contextlib import asynccontextmanager
 from datetime import datetime
 import json
+import threading
 
-from fastapi import Depends, FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from sqlalchemy import inspect, text
 
+import backup
+import coalesce
 import crud
+import dedupe
+import events
+import jobs
+import migrations
 import schemas
-from database import Base, SessionLocal, engine
-
-# Create the database tables
-Base.metadata.create_all(bind=engine)
-
-# Lightweight migration: add missing columns if upgrading an existing DB
-try:
-    inspector = inspect(engine)
-
-    # Check movies table for review and poster_url columns
-    existing_columns = {col["name"] for col in inspector.get_columns("movies")}
-    if "review" not in existing_columns:
-        with engine.connect() as conn:
-            conn.execute(text("ALTER TABLE movies ADD COLUMN review VARCHAR"))
-            conn.commit()
-    if "poster_url" not in existing_columns:
-        with engine.connect() as conn:
-            conn.execute(text("ALTER TABLE movies ADD COLUMN poster_url VARCHAR"))
-            conn.commit()
-
-    # Check tv_shows table for schema migration
-    if inspector.has_table("tv_shows"):
-        tv_columns = {col["name"] for col in inspector.get_columns("tv_shows")}
-
-        # If we have the old schema (creator, year_started, year_ended), migrate to new schema
-        if "creator" in tv_columns and "year_started" in tv_columns:
-            with engine.connect() as conn:
-                # Create a backup table with old data
-                conn.execute(text("CREATE TABLE tv_shows_backup AS SELECT * FROM tv_shows"))
-
-                # Drop the old table
-                conn.execute(text("DROP TABLE tv_shows"))
-
-                # Recreate the table with new schema
-                conn.execute(text("""
-                    CREATE TABLE tv_shows (
-                        id INTEGER PRIMARY KEY,
-                        title VARCHAR,
-                        year INTEGER,
-                        seasons INTEGER,
-                        episodes INTEGER,
-                        rating FLOAT,
-                        watched BOOLEAN DEFAULT 0,
-                        review VARCHAR,
-                        poster_url VARCHAR
-                    )
-                """))
-
-                # Migrate data from backup (use year_started as the year)
-                conn.execute(text("""
-                    INSERT INTO tv_shows (id, title, year, seasons, episodes, rating, watched, review, poster_url)
-                    SELECT id, title, year_started, seasons, episodes, rating, watched, review, NULL
-                    FROM tv_shows_backup
-                """))
-
-                # Drop the backup table
-                conn.execute(text("DROP TABLE tv_shows_backup"))
-
-                conn.commit()
-                print("Successfully migrated tv_shows table to new schema")
-        else:
-            # If table exists but doesn't have poster_url column, add it
-            if "poster_url" not in tv_columns:
-                with engine.connect() as conn:
-                    conn.execute(text("ALTER TABLE tv_shows ADD COLUMN poster_url VARCHAR"))
-                    conn.commit()
-
-except Exception as e:
-    # Best-effort migration; avoid crashing app startup if inspection fails
-    print(f"Migration warning: {e}")
-    pass
+import startup
+import sync
+import tenants
+from database import IS_SQLITE, Catalog
+from locks import ProcessLock
+
+# Held by one worker process, which runs the backup scheduler and resumes jobs
+leader_lock = ProcessLock("leader")
+
+
+class Initialization:
+    """
+    Database migrations and background services, started once the server is
+    up so the UI is served meanwhile. Requests using the database wait for it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+        self.leader = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="initialize", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            # Create missing tables and migrate older databases (once across workers)
+            with startup.timer.phase("migrate database"):
+                migrations.migrate()
+            with startup.timer.phase("start services"):
+                self.leader = leader_lock.acquire(blocking=False)
+                if self.leader:
+                    backup.scheduler.start()
+                # Every worker takes over the jobs of workers that stopped, in the default
+                # catalog now and in tenant catalogs when it opens them
+                jobs.manager.reclaim()
+                tenants.catalogs.on_first_open.append(jobs.manager.reclaim)
+                jobs.manager.start()
+                sync.watcher.start()
+        except Exception as e:
+            self.error = e
+            print(f"Startup error: {e}")
+        finally:
+            self.done.set()
+            startup.timer.report()
+
+    def wait(self) -> None:
+        # Started here too when the app is used without its lifespan
+        self.start()
+        self.done.wait()
+        if self.error is not None:
+            raise HTTPException(status_code=503, detail=f"The database could not be initialized: {self.error}")
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+        sync.watcher.stop()
+        jobs.manager.shutdown()
+        tenants.catalogs.close_all()
+        if self.leader:
+            backup.scheduler.stop()
+            leader_lock.release()
+
+
+initialization = Initialization()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.timer.mark("server started")
+    initialization.start()
+    yield
+    initialization.stop()
+
 
 # Initialize FastAPI
-app = FastAPI(title="StreamTracker API", description="Manage your movies and TV shows", version="0.1.0")
+app = FastAPI(
+    title="StreamTracker API",
+    description="Manage your movies and TV shows",
+    version="0.1.0",
+    lifespan=lifespan,
+)
 
 # Configure CORS to allow requests from any origin
 app.add_middleware(
@@ -140,8 +168,26 @@ async def get_favicon():
     raise HTTPException(status_code=404, detail="favicon.ico not found")
 
 
-def get_db():
-    db = SessionLocal()
+def get_catalog(
+        tenant: Optional[str] = Query(None, description="Tenant catalog to use (or set the X-Tenant header)"),
+        x_tenant: Optional[str] = Header(None, alias=tenants.TENANT_HEADER),
+):
+    """The catalog a request works on: the named tenant's, or the default one"""
+    initialization.wait()
+    try:
+        catalog = tenants.catalogs.acquire(x_tenant or tenant)
+    except tenants.InvalidTenant as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except tenants.TenantsUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    try:
+        yield catalog
+    finally:
+        tenants.catalogs.release(catalog)
+
+
+def get_db(catalog: Catalog = Depends(get_catalog)):
+    db = catalog.SessionLocal()
     try:
         yield db
     finally:
@@ -150,6 +196,7 @@ def get_db():
 
 @app.get("/", tags=["root"])
 async def read_root():
+    startup.timer.mark("first page served")
     # Serve the HTML UI file
     html_file = os.path.join(os.path.dirname(__file__), "movie_tracker_ui.html")
     if os.path.exists(html_file):
@@ -158,14 +205,29 @@ async def read_root():
 
 
 # Movie endpoints
-@app.get("/movies/", response_model=List[schemas.Movie], tags=["movies"])
+@app.get("/movies/", response_model=Union[List[schemas.Movie], schemas.MovieFacetedList], tags=["movies"])
 async def list_movies(
         search: Optional[str] = None,
         sort_by: Optional[str] = None,
         order: Optional[str] = None,  # new
+        watched: Optional[bool] = None,
+        min_rating: Optional[float] = None,
+        max_rating: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        decade: Optional[int] = None,
+        director: Optional[str] = None,
+        facets: bool = False,
         db: Session = Depends(get_db),
 ):
-    return crud.get_movies(db, search=search, sort_by=sort_by, order=order)
+    filters = dict(
+        search=search, watched=watched, min_rating=min_rating, max_rating=max_rating,
+        min_year=min_year, max_year=max_year, decade=decade, director=director,
+    )
+    movies = crud.get_movies(db, sort_by=sort_by, order=order, **filters)
+    if facets:
+        return schemas.MovieFacetedList(items=movies, facets=crud.get_movie_facets(db, **filters))
+    return movies
 
 
 @app.get("/movies/{movie_id}", response_model=schemas.Movie, tags=["movies"])
@@ -198,14 +260,28 @@ async def delete_movie(movie_id: int, db: Session = Depends(get_db)):
 
 
 # TV Show endpoints
-@app.get("/tv-shows/", response_model=List[schemas.TVShow], tags=["tv-shows"])
+@app.get("/tv-shows/", response_model=Union[List[schemas.TVShow], schemas.TVShowFacetedList], tags=["tv-shows"])
 async def list_tv_shows(
         search: Optional[str] = None,
         sort_by: Optional[str] = None,
         order: Optional[str] = None,
+        watched: Optional[bool] = None,
+        min_rating: Optional[float] = None,
+        max_rating: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        decade: Optional[int] = None,
+        facets: bool = False,
         db: Session = Depends(get_db),
 ):
-    return crud.get_tv_shows(db, search=search, sort_by=sort_by, order=order)
+    filters = dict(
+        search=search, watched=watched, min_rating=min_rating, max_rating=max_rating,
+        min_year=min_year, max_year=max_year, decade=decade,
+    )
+    tv_shows = crud.get_tv_shows(db, sort_by=sort_by, order=order, **filters)
+    if facets:
+        return schemas.TVShowFacetedList(items=tv_shows, facets=crud.get_tv_show_facets(db, **filters))
+    return tv_shows
 
 
 @app.get("/tv-shows/{tv_show_id}", response_model=schemas.TVShow, tags=["tv-shows"])
@@ -237,25 +313,171 @@ async def delete_tv_show(tv_show_id: int, db: Session = Depends(get_db)):
     return db_tv_show
 
 
+# Search endpoints
+@app.get(
+    "/search/",
+    response_model=Union[schemas.SearchResults, List[schemas.AutocompleteItem]],
+    tags=["search"],
+)
+async def search(
+        q: str,
+        type: Optional[str] = Query(None, pattern="^(movie|tv_show)$"),
+        limit: int = Query(20, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+        autocomplete: bool = False,
+        db: Session = Depends(get_db),
+):
+    """Search movies and TV shows together; autocomplete=true returns only ids and titles"""
+    if autocomplete:
+        return crud.autocomplete_catalog(db, q, item_type=type, limit=limit)
+    return crud.search_catalog(db, q, item_type=type, limit=limit, offset=offset)
+
+
+# Duplicate detection endpoints (plain def: the scans run in the threadpool, off the event loop)
+@app.get("/dedupe/clusters/", response_model=schemas.DuplicateReport, tags=["dedupe"])
+def list_duplicate_clusters(
+        type: str = Query(..., pattern="^(movie|tv_show)$"),
+        min_score: float = Query(dedupe.DEFAULT_MIN_SCORE, ge=0, le=1),
+        limit: int = Query(100, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+        db: Session = Depends(get_db),
+):
+    """List clusters of likely duplicate movies or TV shows"""
+    clusters = dedupe.find_duplicate_clusters(db, type, min_score=min_score)
+    page = clusters[offset:offset + limit]
+    rows = dedupe.load_cluster_items(db, type, page)
+    return schemas.DuplicateReport(
+        clusters=[
+            schemas.DuplicateCluster(
+                id=cluster["id"],
+                type=cluster["type"],
+                score=cluster["score"],
+                keep_id=cluster["keep_id"],
+                items=[
+                    schemas.DuplicateItem(
+                        id=row.id,
+                        title=row.title,
+                        director=getattr(row, "director", None),
+                        year=row.year,
+                        rating=row.rating,
+                        watched=row.watched,
+                    )
+                    for row in (rows.get(item_id) for item_id in cluster["item_ids"])
+                    if row is not None
+                ],
+            )
+            for cluster in page
+        ],
+        total_clusters=len(clusters),
+    )
+
+
+@app.post("/dedupe/merge/", response_model=schemas.MergeResult, tags=["dedupe"])
+def merge_duplicates(merge: schemas.MergeRequest, db: Session = Depends(get_db)):
+    """Merge duplicate clusters, keeping the best rating, review and poster of each"""
+    reviewed = {cluster.id: cluster.item_ids for cluster in merge.clusters} if merge.clusters is not None else None
+    try:
+        result = dedupe.merge_duplicates(db, merge.type, reviewed=reviewed, min_score=merge.min_score)
+    except dedupe.ClusterChanged as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return schemas.MergeResult(**result)
+
+
+# Delta sync endpoints
+@app.get("/sync", response_model=schemas.SyncResponse, tags=["sync"])
+async def sync_changes(since: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get the changes since a sync token, or the whole catalog without one"""
+    try:
+        return sync.get_changes(db, since)
+    except sync.InvalidToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _catalog_events(catalog: Catalog, token: str):
+    try:
+        async for message in events.stream(token, catalog.name):
+            yield message
+    finally:
+        sync.watcher.unwatch(catalog)
+        tenants.catalogs.release(catalog)
+
+
+@app.get("/events", tags=["sync"])
+async def change_events(catalog: Catalog = Depends(get_catalog)):
+    """
+    Server-Sent Events stream of catalog changes. Each 'change' event carries
+    the item type, id, operation and sequence; on a 'resync' event the client
+    should catch up through /sync.
+    """
+    if events.broker.subscriber_count >= events.MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many event stream subscribers")
+    # The stream holds its own lease on the catalog and has it watched for
+    # commits from other processes for as long as it is open
+    tenants.catalogs.acquire(catalog.name)
+    sync.watcher.watch(catalog)
+    # Not using get_db: its session would hold a pooled connection for the life of the stream
+    db = catalog.SessionLocal()
+    try:
+        token = sync.current_token(db)
+    finally:
+        db.close()
+    return StreamingResponse(
+        _catalog_events(catalog, token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Export/Import endpoints
+def _export_json(catalog: Catalog) -> bytes:
+    # Rows are streamed and serialized one at a time (same JSON as ExportData)
+    # rather than all loaded as ORM objects first
+    db = catalog.SessionLocal()
+    try:
+        parts = []
+        totals = {}
+        for key, rows, schema in (
+            ("movies", crud.iter_all_movies(db), schemas.Movie),
+            ("tv_shows", crud.iter_all_tv_shows(db), schemas.TVShow),
+        ):
+            items = [schema.model_validate(row).model_dump_json() for row in rows]
+            parts.append(f'"{key}":[' + ",".join(items) + "]")
+            totals[key] = len(items)
+
+        export_metadata = {
+            "export_timestamp": datetime.now().isoformat(),
+            "version": "1.0",
+            "total_movies": totals["movies"],
+            "total_tv_shows": totals["tv_shows"]
+        }
+        parts.append('"export_metadata":' + json.dumps(export_metadata, separators=(",", ":")))
+        return ("{" + ",".join(parts) + "}").encode("utf-8")
+    finally:
+        db.close()
+
+
+async def _coalesced(catalog: Catalog, key: str, compute) -> Response:
+    """Serve `compute(catalog)` through the single-flight layer, sharing it with concurrent requests"""
+    # Short-lived session: waiting requests must not hold pooled connections
+    # the shared computation needs
+    db = catalog.SessionLocal()
+    try:
+        version = int(sync.current_token(db))
+    finally:
+        db.close()
+    if catalog.name is not None:
+        key = f"{key}:{catalog.name}"
+    try:
+        content = await coalesce.flights.run(key, version, lambda: compute(catalog))
+    except coalesce.Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return Response(content=content, media_type="application/json")
+
+
 @app.get("/export/", response_model=schemas.ExportData, tags=["export-import"])
-async def export_data(db: Session = Depends(get_db)):
-    """Export all movies and TV shows as JSON"""
-    movies = crud.get_all_movies(db)
-    tv_shows = crud.get_all_tv_shows(db)
-
-    export_metadata = {
-        "export_timestamp": datetime.now().isoformat(),
-        "version": "1.0",
-        "total_movies": len(movies),
-        "total_tv_shows": len(tv_shows)
-    }
-
-    return schemas.ExportData(
-        movies=movies,
-        tv_shows=tv_shows,
-        export_metadata=export_metadata
-    )
+async def export_data(catalog: Catalog = Depends(get_catalog)):
+    """Export all movies and TV shows as JSON (concurrent requests share one export)"""
+    return await _coalesced(catalog, "export", _export_json)
 
 
 @app.post("/import/", response_model=schemas.ImportResult, tags=["export-import"])
@@ -315,22 +537,145 @@ async def import_from_file(file: UploadFile = File(...), db: Session = Depends(g
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 
+# Background job endpoints
+def _submit_job(db: Session, kind: str, payload: Optional[bytes] = None) -> dict:
+    try:
+        job = jobs.manager.create(db, kind, payload)
+    except jobs.JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return jobs.describe(job)
+
+
+@app.post("/jobs/import/", response_model=schemas.JobStatus, status_code=202, tags=["jobs"])
+async def submit_import_job(import_data: schemas.ImportData, db: Session = Depends(get_db)):
+    """Import movies and TV shows from JSON data in the background"""
+    return _submit_job(db, jobs.IMPORT, import_data.model_dump_json().encode("utf-8"))
+
+
+@app.post("/jobs/import/file/", response_model=schemas.JobStatus, status_code=202, tags=["jobs"])
+async def submit_import_file_job(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """Import data from a JSON file upload in the background; rows are validated by the job"""
+    if not file.filename.endswith('.json'):
+        raise HTTPException(status_code=400, detail="File must be a JSON file")
+    return _submit_job(db, jobs.IMPORT, await file.read())
+
+
+@app.post("/jobs/export/", response_model=schemas.JobStatus, status_code=202, tags=["jobs"])
+async def submit_export_job(db: Session = Depends(get_db)):
+    """Export all movies and TV shows to a file in the background"""
+    return _submit_job(db, jobs.EXPORT)
+
+
+@app.post("/jobs/rebuild/", response_model=schemas.JobStatus, status_code=202, tags=["jobs"])
+async def submit_rebuild_job(db: Session = Depends(get_db)):
+    """Rebuild the search and title similarity indexes in the background"""
+    return _submit_job(db, jobs.REBUILD)
+
+
+@app.get("/jobs/", response_model=List[schemas.JobStatus], tags=["jobs"])
+async def list_jobs(limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    """List the most recently submitted jobs"""
+    return [jobs.describe(job) for job in jobs.list_jobs(db, limit)]
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobStatus, tags=["jobs"])
+async def get_job(job_id: str, db: Session = Depends(get_db)):
+    """Get the status and progress of a job"""
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.JobStatus, tags=["jobs"])
+async def cancel_job(job_id: str, db: Session = Depends(get_db)):
+    """Cancel a queued job, or stop a running one after its current chunk"""
+    job = jobs.manager.cancel(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+
+@app.get("/jobs/{job_id}/result", tags=["jobs"])
+async def download_job_result(job_id: str, db: Session = Depends(get_db)):
+    """Download the file written by a finished export job"""
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.kind != jobs.EXPORT or job.status != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail="Job has no result file")
+    return FileResponse(
+        jobs.result_path(job.id),
+        media_type="application/json",
+        filename=f"streamtracker-export-{job.id}.json",
+    )
+
+
+# Backup endpoints (plain def: they run in the threadpool, off the event loop)
+def _require_sqlite_backups():
+    if not IS_SQLITE:
+        raise HTTPException(
+            status_code=501, detail="Backups are only available with the SQLite backend; use pg_dump for PostgreSQL"
+        )
+
+
+@app.get("/backups/", response_model=List[schemas.BackupInfo], tags=["backups"])
+def list_backups(catalog: Catalog = Depends(get_catalog)):
+    """List snapshots and differential exports"""
+    return backup.list_backups(catalog)
+
+
+@app.post("/backups/snapshot/", response_model=schemas.BackupInfo, status_code=201, tags=["backups"])
+def create_snapshot(catalog: Catalog = Depends(get_catalog)):
+    """Take an online snapshot of the database"""
+    _require_sqlite_backups()
+    return backup.create_snapshot(catalog)
+
+
+@app.post("/backups/differential/", response_model=Optional[schemas.BackupInfo], tags=["backups"])
+def create_differential(catalog: Catalog = Depends(get_catalog)):
+    """Export the changes since the last snapshot; returns null if nothing changed"""
+    _require_sqlite_backups()
+    try:
+        return backup.create_differential(catalog)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/backups/restore/", response_model=schemas.RestoreResult, tags=["backups"])
+def restore_backup(restore: schemas.RestoreRequest, catalog: Catalog = Depends(get_catalog)):
+    """Restore a snapshot and the differentials taken on top of it"""
+    _require_sqlite_backups()
+    try:
+        return backup.restore(restore.name, apply_differentials=restore.apply_differentials, catalog=catalog)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 # Statistics endpoints
+def _statistics_json(catalog: Catalog) -> bytes:
+    db = catalog.SessionLocal()
+    try:
+        watch_stats = crud.get_watch_statistics(db)
+        rating_stats = crud.get_rating_statistics(db)
+        year_stats = crud.get_year_statistics(db)
+        director_stats = crud.get_director_statistics(db)
+
+        return schemas.StatisticsDashboard(
+            watch_stats=schemas.WatchStatistics(**watch_stats),
+            rating_stats=schemas.RatingStatistics(**rating_stats),
+            year_stats=schemas.YearStatistics(**year_stats),
+            director_stats=schemas.DirectorStatistics(**director_stats),
+            generated_at=datetime.now().isoformat()
+        ).model_dump_json().encode("utf-8")
+    finally:
+        db.close()
+
+
 @app.get("/statistics/", response_model=schemas.StatisticsDashboard, tags=["statistics"])
-async def get_statistics_dashboard(db: Session = Depends(get_db)):
-    """Get comprehensive statistics dashboard"""
-    watch_stats = crud.get_watch_statistics(db)
-    rating_stats = crud.get_rating_statistics(db)
-    year_stats = crud.get_year_statistics(db)
-    director_stats = crud.get_director_statistics(db)
-
-    return schemas.StatisticsDashboard(
-        watch_stats=schemas.WatchStatistics(**watch_stats),
-        rating_stats=schemas.RatingStatistics(**rating_stats),
-        year_stats=schemas.YearStatistics(**year_stats),
-        director_stats=schemas.DirectorStatistics(**director_stats),
-        generated_at=datetime.now().isoformat()
-    )
+async def get_statistics_dashboard(catalog: Catalog = Depends(get_catalog)):
+    """Get comprehensive statistics dashboard (concurrent requests share one computation)"""
+    return await _coalesced(catalog, "statistics", _statistics_json)
 
 
 @app.get("/statistics/watch/", response_model=schemas.WatchStatistics, tags=["statistics"])
@@ -360,25 +705,3 @@ async def get_director_statistics(db: Session = Depends(get_db)):
     stats = crud.get_director_statistics(db)
     return schemas.DirectorStatistics(**stats)
 
-
-# Auto-browser opening functionality
-def open_browser():
-    """Open the default web browser to the StreamTracker UI"""
-    import webbrowser
-    import time
-    import threading
-
-    def delayed_open():
-        time.sleep(2)  # Wait 2 seconds for server to start
-        webbrowser.open("http://127.0.0.1:8000")
-
-    # Start browser opening in a separate thread
-    browser_thread = threading.Thread(target=delayed_open, daemon=True)
-    browser_thread.start()
-
-
-if __name__ == "__main__":
-    import uvicorn
-
-    open_browser()
-    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,184 @@
+"""
+Schema migrations for the StreamTracker API.
+
+Creates missing tables and brings databases created by older versions up
+ to date. Every step checks before it changes anything, and the whole run
+ holds an inter-process lock (plus an advisory lock on PostgreSQL), so
+ when several workers start at once the first one migrates and the others
+ find nothing left to do. Column types are compiled for the database dialect.
+ Tenant catalogs are migrated the same way when they are first opened.
+"""
+import os
+
+from sqlalchemy import DateTime, Integer, String, inspect, text
+
+import directors
+import models  # noqa: F401 (registers the tables with Base)
+import search_index
+import sync
+import title_index
+from database import IS_SQLITE, Base, Catalog, default_catalog
+from locks import ProcessLock
+
+# Set by the launcher once it has migrated, so the workers it starts skip it
+MIGRATED_ENV = "STREAMTRACKER_MIGRATED"
+# PostgreSQL advisory lock key serializing migrations across hosts
+PG_MIGRATION_LOCK_KEY = 0x5354524D
+
+
+def migrate(catalog: Catalog = default_catalog) -> None:
+    """Bring a catalog's schema up to date, once across all worker processes"""
+    if catalog is default_catalog and os.environ.get(MIGRATED_ENV) == "1":
+        return
+    engine = catalog.engine
+    with ProcessLock("migrate", catalog.db_path):
+        if IS_SQLITE:
+            _migrate(engine)
+            return
+        # Servers on other hosts share the database but not the lock file
+        with engine.connect() as lock_conn:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": PG_MIGRATION_LOCK_KEY})
+            try:
+                _migrate(engine)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PG_MIGRATION_LOCK_KEY})
+                lock_conn.commit()
+
+
+def _add_column(conn, table: str, column: str, column_type) -> None:
+    """Add a column, spelling its type the way the database dialect expects"""
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type.compile(dialect=conn.dialect)}"))
+
+
+def _migrate(engine) -> None:
+    # Create the database tables
+    Base.metadata.create_all(bind=engine)
+
+    # Lightweight migration: add missing columns if upgrading an existing DB
+    try:
+        inspector = inspect(engine)
+
+        # Check movies table for review and poster_url columns
+        existing_columns = {col["name"] for col in inspector.get_columns("movies")}
+        if "review" not in existing_columns:
+            with engine.connect() as conn:
+                _add_column(conn, "movies", "review", String())
+                conn.commit()
+        if "poster_url" not in existing_columns:
+            with engine.connect() as conn:
+                _add_column(conn, "movies", "poster_url", String())
+                conn.commit()
+
+        # Check tv_shows table for schema migration
+        if inspector.has_table("tv_shows"):
+            tv_columns = {col["name"] for col in inspector.get_columns("tv_shows")}
+
+            # If we have the old schema (creator, year_started, year_ended), migrate to new schema
+            if "creator" in tv_columns and "year_started" in tv_columns:
+                with engine.connect() as conn:
+                    # Create a backup table with old data
+                    conn.execute(text("CREATE TABLE tv_shows_backup AS SELECT * FROM tv_shows"))
+
+                    # Drop the old table
+                    conn.execute(text("DROP TABLE tv_shows"))
+
+                    # Recreate the table with new schema
+                    conn.execute(text("""
+                        CREATE TABLE tv_shows (
+                            id INTEGER PRIMARY KEY,
+                            title VARCHAR,
+                            year INTEGER,
+                            seasons INTEGER,
+                            episodes INTEGER,
+                            rating FLOAT,
+                            watched BOOLEAN DEFAULT 0,
+                            review VARCHAR,
+                            poster_url VARCHAR
+                        )
+                    """))
+
+                    # Migrate data from backup (use year_started as the year)
+                    conn.execute(text("""
+                        INSERT INTO tv_shows (id, title, year, seasons, episodes, rating, watched, review, poster_url)
+                        SELECT id, title, year_started, seasons, episodes, rating, watched, review, NULL
+                        FROM tv_shows_backup
+                    """))
+
+                    # Drop the backup table
+                    conn.execute(text("DROP TABLE tv_shows_backup"))
+
+                    conn.commit()
+                    print("Successfully migrated tv_shows table to new schema")
+            else:
+                # If table exists but doesn't have poster_url column, add it
+                if "poster_url" not in tv_columns:
+                    with engine.connect() as conn:
+                        _add_column(conn, "tv_shows", "poster_url", String())
+                        conn.commit()
+
+        # Indexes backing the list filters (create_all only indexes new tables)
+        with engine.connect() as conn:
+            for table in ("movies", "tv_shows"):
+                for column in ("year", "rating", "watched"):
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+            conn.commit()
+
+        # Normalized titles and their trigram index used for fuzzy matching
+        for table in ("movies", "tv_shows"):
+            table_columns = {col["name"] for col in inspect(engine).get_columns(table)}
+            if "title_normalized" not in table_columns:
+                with engine.connect() as conn:
+                    _add_column(conn, table, "title_normalized", String())
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{table}_title_normalized ON {table} (title_normalized)"
+                    ))
+                    conn.commit()
+        with engine.connect() as conn:
+            title_index.backfill_title_index(conn)
+            conn.commit()
+
+        # Director dimension: link movies to their director and count their aggregates
+        movie_columns = {col["name"] for col in inspect(engine).get_columns("movies")}
+        with engine.connect() as conn:
+            if "director_id" not in movie_columns:
+                _add_column(conn, "movies", "director_id", Integer())
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_movies_director_id ON movies (director_id)"))
+            directors.backfill_directors(conn)
+            conn.commit()
+
+        # Change tracking columns used by /sync
+        for table in ("movies", "tv_shows"):
+            table_columns = {col["name"] for col in inspect(engine).get_columns(table)}
+            with engine.connect() as conn:
+                if "updated_at" not in table_columns:
+                    _add_column(conn, table, "updated_at", DateTime())
+                if "change_seq" not in table_columns:
+                    _add_column(conn, table, "change_seq", Integer())
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)"))
+                conn.commit()
+        with engine.connect() as conn:
+            sync.ensure_sync_state(conn)
+            conn.commit()
+
+        # Job ownership, so any worker can take over the jobs of one that stopped
+        job_columns = {col["name"] for col in inspect(engine).get_columns("jobs")}
+        with engine.connect() as conn:
+            if "owner" not in job_columns:
+                _add_column(conn, "jobs", "owner", String())
+            if "heartbeat_at" not in job_columns:
+                _add_column(conn, "jobs", "heartbeat_at", DateTime())
+            conn.commit()
+
+        # Shared full-text index used by /search/ (pg_trgm indexes on PostgreSQL)
+        with engine.connect() as conn:
+            if IS_SQLITE:
+                search_index.ensure_search_index(conn)
+            else:
+                search_index.ensure_pg_search_indexes(conn)
+                title_index.ensure_pg_title_indexes(conn)
+            conn.commit()
+
+    except Exception as e:
+        # Best-effort migration; avoid crashing app startup if inspection fails
+        print(f"Migration warning: {e}")
+        pass
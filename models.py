@@ -2,7 +2,7 @@
 SQLAlchemy models for the StreamTracker API.
 Defines the Movie and TV Show ORM models used to persist entertainment information.
 """
-from sqlalchemy import Column, Integer, String, Boolean, Float
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Index, text
 from database import Base
 
 
@@ -10,22 +10,101 @@ class Movie(Base):
     __tablename__ = "movies"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
+    title_normalized = Column(String, index=True)
     director = Column(String, index=True)
-    year = Column(Integer)
-    rating = Column(Float, nullable=True)
-    watched = Column(Boolean, default=False)
+    director_id = Column(Integer, ForeignKey("directors.id"), nullable=True, index=True)
+    year = Column(Integer, index=True)
+    rating = Column(Float, nullable=True, index=True)
+    watched = Column(Boolean, default=False, index=True)
     review = Column(String, nullable=True)
     poster_url = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    change_seq = Column(Integer, nullable=True, index=True)
+
+
+class Director(Base):
+    """
+    A movie director, shared by every spelling of the name that normalizes
+    the same way, with aggregates over their movies kept up to date on write
+    """
+    __tablename__ = "directors"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    name_key = Column(String, nullable=False, unique=True)
+    movie_count = Column(Integer, nullable=False, default=0, index=True)
+    rated_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        # Serves "highest rated directors" in order without computing every average
+        Index(
+            "ix_directors_avg_rating", text("(rating_sum / rated_count)"), "rated_count",
+            sqlite_where=text("rated_count > 0"), postgresql_where=text("rated_count > 0"),
+        ),
+    )
 
 
 class TVShow(Base):
     __tablename__ = "tv_shows"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    year = Column(Integer)
+    title_normalized = Column(String, index=True)
+    year = Column(Integer, index=True)
     seasons = Column(Integer, nullable=True)
     episodes = Column(Integer, nullable=True)
-    rating = Column(Float, nullable=True)
-    watched = Column(Boolean, default=False)
+    rating = Column(Float, nullable=True, index=True)
+    watched = Column(Boolean, default=False, index=True)
     review = Column(String, nullable=True)
     poster_url = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    change_seq = Column(Integer, nullable=True, index=True)
+
+
+class TitleTrigram(Base):
+    """Trigram index over normalized movie and TV show titles"""
+    __tablename__ = "title_trigrams"
+    item_type = Column(String, primary_key=True)
+    item_id = Column(Integer, primary_key=True)
+    trigram = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_title_trigrams_lookup", "item_type", "trigram", "item_id"),
+    )
+
+
+class Tombstone(Base):
+    """Record of a deleted movie or TV show, kept for delta sync"""
+    __tablename__ = "tombstones"
+    id = Column(Integer, primary_key=True)
+    item_type = Column(String, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    change_seq = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=False)
+
+
+class SyncState(Base):
+    """Single-row table holding the catalog-wide change sequence"""
+    __tablename__ = "sync_state"
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+    pruned_seq = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    """Background import, export or index rebuild job and its progress"""
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    total_rows = Column(Integer, default=0)
+    processed_rows = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(String, nullable=True)
+    result = Column(String, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    # Worker process that queued or runs the job, and when it last reported in
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
@@ -72,6 +72,168 @@ class TVShow(TVShowBase):
         from_attributes = True
 
 
+# Faceted listing schemas
+class FacetDirector(BaseModel):
+    """Schema for a director entry in facet counts"""
+    director: str = Field(..., description="Director name")
+    count: int = Field(..., description="Number of matching movies")
+
+
+class CatalogFacets(BaseModel):
+    """Schema for facet counts over the current filter set"""
+    total: int = Field(..., description="Number of items matching the filters")
+    watched: dict = Field(..., description="Counts of watched and unwatched items")
+    rating: dict = Field(..., description="Counts per rating bucket, 'unrated' for items without a rating")
+    decade: dict = Field(..., description="Counts per decade")
+    directors: List[FacetDirector] = Field(default=[], description="Directors with the most matching movies")
+
+
+class MovieFacetedList(BaseModel):
+    """Schema for a movie listing returned together with its facet counts"""
+    items: List[Movie] = Field(..., description="Movies matching the filters")
+    facets: CatalogFacets = Field(..., description="Facet counts for the filters")
+
+
+class TVShowFacetedList(BaseModel):
+    """Schema for a TV show listing returned together with its facet counts"""
+    items: List[TVShow] = Field(..., description="TV shows matching the filters")
+    facets: CatalogFacets = Field(..., description="Facet counts for the filters")
+
+
+# Search schemas
+class SearchItem(BaseModel):
+    """Schema for a single cross-catalog search hit"""
+    type: str = Field(..., description="Item type ('movie' or 'tv_show')")
+    id: int = Field(..., description="Id of the movie or TV show")
+    title: str = Field(..., description="Title of the item")
+    director: Optional[str] = Field(None, description="Director (movies only)")
+    year: Optional[int] = Field(None, description="Year of the item")
+    rating: Optional[float] = Field(None, description="Rating of the item")
+    watched: Optional[bool] = Field(None, description="Whether it has been watched")
+    poster_url: Optional[str] = Field(None, description="URL of the poster")
+
+
+class SearchResults(BaseModel):
+    """Schema for a page of cross-catalog search results"""
+    items: List[SearchItem] = Field(..., description="Search hits ordered by relevance")
+    total: int = Field(..., description="Total number of hits")
+    limit: int = Field(..., description="Page size")
+    offset: int = Field(..., description="Offset of the first hit")
+
+
+class AutocompleteItem(BaseModel):
+    """Schema for an autocomplete suggestion"""
+    type: str = Field(..., description="Item type ('movie' or 'tv_show')")
+    id: int = Field(..., description="Id of the movie or TV show")
+    title: str = Field(..., description="Title of the item")
+
+
+# Duplicate detection schemas
+class DuplicateItem(BaseModel):
+    """Schema for an item inside a duplicate cluster"""
+    id: int = Field(..., description="Id of the movie or TV show")
+    title: str = Field(..., description="Title of the item")
+    director: Optional[str] = Field(None, description="Director (movies only)")
+    year: Optional[int] = Field(None, description="Year of the item")
+    rating: Optional[float] = Field(None, description="Rating of the item")
+    watched: Optional[bool] = Field(None, description="Whether it has been watched")
+
+
+class DuplicateCluster(BaseModel):
+    """Schema for a cluster of likely duplicates"""
+    id: str = Field(..., description="Cluster id, used to select clusters to merge")
+    type: str = Field(..., description="Item type ('movie' or 'tv_show')")
+    score: float = Field(..., description="Lowest pair similarity inside the cluster (0-1)")
+    keep_id: int = Field(..., description="Id of the item that is kept when merging")
+    items: List[DuplicateItem] = Field(..., description="Items in the cluster, kept item first")
+
+
+class DuplicateReport(BaseModel):
+    """Schema for the duplicate clusters of the catalog"""
+    clusters: List[DuplicateCluster] = Field(..., description="Duplicate clusters")
+    total_clusters: int = Field(..., description="Total number of clusters found")
+
+
+class MergeCluster(BaseModel):
+    """Schema for a cluster selected for merging, as it was reviewed"""
+    id: str = Field(..., description="Cluster id")
+    item_ids: List[int] = Field(..., description="Ids of the cluster's items as listed; the merge is rejected if they changed")
+
+
+class MergeRequest(BaseModel):
+    """Schema for a duplicate merge request"""
+    type: str = Field(..., pattern="^(movie|tv_show)$", description="Item type to merge")
+    clusters: Optional[List[MergeCluster]] = Field(None, description="Clusters to merge; all clusters if omitted")
+    min_score: float = Field(0.7, ge=0, le=1, description="Minimum pair similarity for duplicates")
+
+    class Config:
+        # A client still sending the former cluster_ids must not merge every cluster
+        extra = "forbid"
+
+
+class MergeResult(BaseModel):
+    """Schema for duplicate merge results"""
+    clusters_merged: int = Field(..., description="Number of clusters merged")
+    items_removed: int = Field(..., description="Number of duplicate items deleted")
+
+
+# Delta sync schemas
+class DeletedItem(BaseModel):
+    """Schema for an item deleted since a sync token"""
+    type: str = Field(..., description="Item type ('movie' or 'tv_show')")
+    id: int = Field(..., description="Id of the deleted movie or TV show")
+
+
+class SyncResponse(BaseModel):
+    """Schema for the changes since a sync token"""
+    token: str = Field(..., description="Token to pass as 'since' on the next sync")
+    reset: bool = Field(..., description="True if this is the full catalog and the local copy must be replaced")
+    movies: List[Movie] = Field(..., description="Movies created or updated since the token")
+    tv_shows: List[TVShow] = Field(..., description="TV shows created or updated since the token")
+    deleted: List[DeletedItem] = Field(..., description="Items deleted since the token; apply before the upserts")
+
+
+# Backup schemas
+class BackupInfo(BaseModel):
+    """Schema for a snapshot or differential export on disk"""
+    name: str = Field(..., description="File name of the backup")
+    kind: str = Field(..., description="'snapshot' or 'differential'")
+    seq: int = Field(..., description="Change sequence the backup is current up to")
+    from_seq: Optional[int] = Field(None, description="Change sequence a differential starts from")
+    size: int = Field(..., description="Size of the file in bytes")
+
+
+class RestoreRequest(BaseModel):
+    """Schema for a restore request"""
+    name: str = Field(..., description="Snapshot to restore")
+    apply_differentials: bool = Field(True, description="Also apply the differentials taken on top of the snapshot")
+
+
+class RestoreResult(BaseModel):
+    """Schema for restore results"""
+    snapshot: str = Field(..., description="Snapshot that was restored")
+    differentials_applied: int = Field(..., description="Number of differentials applied on top")
+    new_snapshot: str = Field(..., description="Snapshot of the restored state, which later differentials build on")
+    seconds: float = Field(..., description="Time taken by the restore")
+
+
+class JobStatus(BaseModel):
+    """Schema for the state and progress of a background job"""
+    id: str = Field(..., description="Job id")
+    kind: str = Field(..., description="'import', 'export' or 'rebuild'")
+    status: str = Field(..., description="queued, running, succeeded, failed or cancelled")
+    created_at: str = Field(..., description="When the job was submitted")
+    started_at: Optional[str] = Field(None, description="When the job started running")
+    finished_at: Optional[str] = Field(None, description="When the job finished")
+    total_rows: int = Field(..., description="Rows the job will process")
+    processed_rows: int = Field(..., description="Rows processed so far")
+    error_count: int = Field(..., description="Number of errors so far")
+    errors: List[str] = Field(default=[], description="The first error messages")
+    rows_per_second: Optional[float] = Field(None, description="Throughput since the job started")
+    result: Optional[dict] = Field(None, description="Job result once it has succeeded")
+    cancel_requested: bool = Field(..., description="Whether cancellation has been requested")
+
+
 # Export/Import schemas
 class ExportData(BaseModel):
     """Schema for exporting all data from StreamTracker"""
@@ -0,0 +1,193 @@
+"""
+Full-text search index for the StreamTracker API.
+
+Movies and TV shows share a single SQLite FTS5 table, catalog_search, kept
+ in sync with the source tables by triggers. The rowid encodes the item:
+ movies use ``id * 2`` and TV shows ``id * 2 + 1``, so a search hit can be
+ mapped back to its table without a lookup.
+
+On PostgreSQL the same tiers are matched with case-insensitive word-boundary
+ regexes on the titles and directors, served by pg_trgm GIN indexes, and
+ ranked by trigram similarity. Hits use the same rowid encoding.
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import and_, func, not_, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+MOVIE = "movie"
+TV_SHOW = "tv_show"
+
+_TYPE_PARITY = {MOVIE: 0, TV_SHOW: 1}
+
+_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS catalog_search USING fts5(
+        title, director,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_search_ai AFTER INSERT ON movies BEGIN
+        INSERT INTO catalog_search (rowid, title, director) VALUES (new.id * 2, new.title, new.director);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_search_ad AFTER DELETE ON movies BEGIN
+        DELETE FROM catalog_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_search_au AFTER UPDATE OF id, title, director ON movies BEGIN
+        DELETE FROM catalog_search WHERE rowid = old.id * 2;
+        INSERT INTO catalog_search (rowid, title, director) VALUES (new.id * 2, new.title, new.director);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tv_shows_search_ai AFTER INSERT ON tv_shows BEGIN
+        INSERT INTO catalog_search (rowid, title, director) VALUES (new.id * 2 + 1, new.title, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tv_shows_search_ad AFTER DELETE ON tv_shows BEGIN
+        DELETE FROM catalog_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tv_shows_search_au AFTER UPDATE OF id, title ON tv_shows BEGIN
+        DELETE FROM catalog_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO catalog_search (rowid, title, director) VALUES (new.id * 2 + 1, new.title, '');
+    END
+    """,
+]
+
+
+def rebuild_search_index(conn) -> None:
+    """Repopulate the search index from the movies and tv_shows tables"""
+    conn.execute(text("DELETE FROM catalog_search"))
+    conn.execute(text(
+        "INSERT INTO catalog_search (rowid, title, director) SELECT id * 2, title, director FROM movies"
+    ))
+    conn.execute(text(
+        "INSERT INTO catalog_search (rowid, title, director) SELECT id * 2 + 1, title, '' FROM tv_shows"
+    ))
+
+
+def ensure_search_index(conn) -> None:
+    """Create the search index and its triggers, backfilling it if it is out of date"""
+    for statement in _SCHEMA:
+        conn.execute(text(statement))
+    indexed = conn.execute(text("SELECT count(*) FROM catalog_search")).scalar()
+    expected = conn.execute(text(
+        "SELECT (SELECT count(*) FROM movies) + (SELECT count(*) FROM tv_shows)"
+    )).scalar()
+    if indexed != expected:
+        rebuild_search_index(conn)
+
+
+def split_rowid(rowid: int) -> tuple[str, int]:
+    """Map a search index rowid back to (item_type, item_id)"""
+    return (TV_SHOW if rowid % 2 else MOVIE), rowid // 2
+
+
+def build_match_tiers(q: str, column: Optional[str] = None) -> list[str]:
+    """
+    Turn free text into FTS5 MATCH expressions, best tier first: every word
+    matching as a whole word, then every word matching only as a prefix.
+    Returns an empty list if the text contains no searchable words.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return []
+    exact = " ".join(f'"{word}"' for word in words)
+    prefix = " ".join(f'"{word}"*' for word in words)
+    tiers = [exact, f"({prefix}) NOT ({exact})"]
+    if column:
+        return [f"{column} : ({tier})" for tier in tiers]
+    return tiers
+
+
+def type_filter_sql(item_type: Optional[str]) -> str:
+    """SQL condition restricting search hits to one item type"""
+    if item_type is None:
+        return ""
+    return f" AND catalog_search.rowid % 2 = {_TYPE_PARITY[item_type]}"
+
+
+# PostgreSQL: pg_trgm GIN indexes serving the regex matches below
+PG_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_movies_title_trgm ON movies USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_movies_director_trgm ON movies USING gin (director gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_tv_shows_title_trgm ON tv_shows USING gin (title gin_trgm_ops)",
+]
+
+
+def ensure_pg_search_indexes(conn) -> None:
+    """Create the pg_trgm extension and the trigram indexes used by search"""
+    for statement in PG_SCHEMA:
+        conn.execute(text(statement))
+
+
+def _pg_words_match(model, patterns: list[str], column: Optional[str]):
+    # Like an FTS5 query over both columns, each word may match the title or the director
+    fields = [model.title] if column == "title" or model is models.TVShow else [model.title, model.director]
+    return and_(*[or_(*[field.op("~*")(pattern) for field in fields]) for pattern in patterns])
+
+
+def _pg_tier_query(q: str, tier: int, item_type: Optional[str], column: Optional[str]):
+    """Union of movie and TV show hits for one match tier, as (rowid, title, score)"""
+    words = re.findall(r"\w+", q)
+    exact = [rf"\m{word}\M" for word in words]
+    prefix = [rf"\m{word}" for word in words]
+    selects = []
+    for kind, model in ((MOVIE, models.Movie), (TV_SHOW, models.TVShow)):
+        if item_type is not None and item_type != kind:
+            continue
+        if tier == 0:
+            condition = _pg_words_match(model, exact, column)
+        else:
+            condition = and_(_pg_words_match(model, prefix, column), not_(_pg_words_match(model, exact, column)))
+        # Titles weighted above directors, as with bm25 on SQLite
+        score = func.similarity(model.title, q) * 10.0
+        if model is models.Movie and column is None:
+            score = score + func.similarity(func.coalesce(model.director, ""), q) * 2.0
+        selects.append(
+            select((model.id * 2 + _TYPE_PARITY[kind]).label("rowid"), model.title, score.label("score"))
+            .where(condition)
+        )
+    return union_all(*selects).subquery()
+
+
+def pg_search_hits(
+    db: Session, q: str, count: int, item_type: Optional[str] = None, column: Optional[str] = None
+) -> list:
+    """PostgreSQL version of the ranked (rowid, title) search hits, best tier first"""
+    if not re.findall(r"\w+", q):
+        return []
+    hits = []
+    for tier in (0, 1):
+        remaining = count - len(hits)
+        if remaining <= 0:
+            break
+        tier_query = _pg_tier_query(q, tier, item_type, column)
+        hits.extend(db.execute(
+            select(tier_query.c.rowid, tier_query.c.title)
+            .order_by(tier_query.c.score.desc(), tier_query.c.rowid)
+            .limit(remaining)
+        ).all())
+    return hits
+
+
+def pg_search_count(db: Session, q: str, item_type: Optional[str] = None) -> int:
+    """Number of PostgreSQL search hits over every tier"""
+    if not re.findall(r"\w+", q):
+        return 0
+    return sum(
+        db.execute(select(func.count()).select_from(_pg_tier_query(q, tier, item_type, None))).scalar()
+        for tier in (0, 1)
+    )
@@ -0,0 +1,182 @@
+"""
+Launcher for the StreamTracker server (python main.py and the packaged executable).
+
+The port is bound and listening before anything heavy is imported, so a
+ taken port fails at once and the browser can be started right away: its
+ first request waits in the listen backlog until the app accepts it,
+ instead of the browser being started after a fixed delay. Only then are
+ uvicorn and the app imported. The app migrates the database in the
+ background once it is serving, so the UI page loads while API requests
+ wait for the database to be ready.
+
+Only the standard library is imported at module level. Each phase is timed
+ from the moment this module is loaded and printed as a startup report
+ (set STREAMTRACKER_STARTUP_REPORT=0 to turn it off).
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+REPORT_ENABLED = os.environ.get("STREAMTRACKER_STARTUP_REPORT", "1") != "0"
+
+
+class StartupTimer:
+    """Records startup phases (which may overlap) relative to the launch"""
+
+    def __init__(self):
+        self.launched = time.perf_counter()
+        # Only the launcher's process reports; worker processes it starts stay quiet
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._phases: List[Tuple[str, float, float]] = []
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started, time.perf_counter())
+
+    def mark(self, name: str) -> None:
+        """Record an instant (the first time it happens); printed at once if the report is out"""
+        now = time.perf_counter()
+        with self._lock:
+            if any(phase[0] == name for phase in self._phases):
+                return
+        self._record(name, now, now)
+
+    def _record(self, name: str, started: float, finished: float) -> None:
+        with self._lock:
+            self._phases.append((name, started, finished))
+            late = self._reported
+        if late and self.enabled and REPORT_ENABLED:
+            print(f"Startup: {name} at {self._ms(finished)} ms")
+
+    def _ms(self, instant: float) -> int:
+        return round((instant - self.launched) * 1000)
+
+    def report(self) -> None:
+        """Print the phases recorded so far (once); later marks are printed as they happen"""
+        with self._lock:
+            if self._reported:
+                return
+            self._reported = True
+            phases = sorted(self._phases, key=lambda phase: (phase[1], phase[2]))
+        if not self.enabled or not REPORT_ENABLED:
+            return
+        lines = ["Startup timing (ms since launch):"]
+        for name, started, finished in phases:
+            if finished == started:
+                lines.append(f"  {name:<28}{'':>8}{self._ms(finished):>8}")
+            else:
+                lines.append(f"  {name:<28}{self._ms(started):>8}{self._ms(finished):>8}"
+                             f"  ({round((finished - started) * 1000)} ms)")
+        print("\n".join(lines), flush=True)
+
+
+timer = StartupTimer()
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """
+    Bind and listen the way uvicorn does, so connections made before the
+    app is loaded queue up instead of being refused
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family=family)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind((host, port))
+    except OSError:
+        sock.close()
+        raise
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _url(host: str, port: int) -> str:
+    # A wildcard bind address is not something a browser can open
+    browser_host = "127.0.0.1" if host in ("0.0.0.0", "::", "") else host
+    if ":" in browser_host:
+        browser_host = f"[{browser_host}]"
+    return f"http://{browser_host}:{port}"
+
+
+def open_browser(host: str = "127.0.0.1", port: int = 8000):
+    """Open the default web browser to the StreamTracker UI (the port must be listening)"""
+    import webbrowser
+
+    def launch():
+        with timer.phase("start browser"):
+            webbrowser.open(_url(host, port))
+
+    # Starting a browser can take a while; the server keeps loading meanwhile
+    threading.Thread(target=launch, name="open-browser", daemon=True).start()
+
+
+def run_server(argv: Optional[List[str]] = None):
+    """
+    Run the API with uvicorn. Host, port and worker count come from the
+    command line or the STREAMTRACKER_HOST/PORT/WORKERS environment variables.
+    With several workers, sending SIGHUP to the main process restarts them
+    gracefully (letting in-flight requests finish).
+    """
+    import argparse
+    import multiprocessing
+
+    # Lets the packaged executable start worker processes
+    multiprocessing.freeze_support()
+    timer.enabled = True
+
+    parser = argparse.ArgumentParser(description="Run the StreamTracker API")
+    parser.add_argument("--host", default=os.environ.get("STREAMTRACKER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("STREAMTRACKER_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("STREAMTRACKER_WORKERS", "1")))
+    parser.add_argument("--no-browser", action="store_true", help="Do not open the UI in a browser")
+    args = parser.parse_args(argv)
+
+    with timer.phase("bind port"):
+        try:
+            sock = bind_socket(args.host, args.port)
+        except OSError as e:
+            raise SystemExit(f"Cannot listen on {args.host}:{args.port}: {e}")
+    print(f"StreamTracker listening on {_url(args.host, args.port)} (Press CTRL+C to quit)", flush=True)
+    if not args.no_browser:
+        open_browser(args.host, args.port)
+
+    with timer.phase("import uvicorn"):
+        import uvicorn
+
+    if args.workers > 1:
+        from uvicorn.supervisors import Multiprocess
+
+        with timer.phase("migrate database"):
+            import migrations
+
+            migrations.migrate()
+        # The workers skip the migrations and each import the app themselves
+        os.environ[migrations.MIGRATED_ENV] = "1"
+        timer.report()
+        config = uvicorn.Config(
+            "main:app", host=args.host, port=args.port, workers=args.workers, timeout_graceful_shutdown=10
+        )
+        Multiprocess(config, target=uvicorn.Server(config).run, sockets=[sock]).run()
+        return
+
+    with timer.phase("import app"):
+        import main
+
+    config = uvicorn.Config(main.app, host=args.host, port=args.port, timeout_graceful_shutdown=10)
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    except KeyboardInterrupt:
+        pass
+    if not server.started:
+        raise SystemExit(3)
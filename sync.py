@@ -0,0 +1,372 @@
+"""
+Change tracking for delta sync in the StreamTracker API.
+
+Every write to a movie or TV show stamps it with updated_at and the next
+ value of a catalog-wide change sequence (kept in the single-row
+ sync_state table), and every delete leaves a tombstone with its own
+ sequence value. A client that remembers the last sequence it has seen can
+ then fetch only what changed since, instead of reloading whole tables.
+ The same changes are published to the /events feed once committed, and
+ a watcher thread forwards those committed by other worker processes.
+ Every catalog (the default one and each tenant's) has its own sequence.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import events
+import models
+from database import IS_SQLITE, Catalog, default_catalog
+
+# Tombstones older than this are pruned; clients with older tokens get a full resync
+TOMBSTONE_RETENTION_DAYS = 30
+# Expired tombstones are pruned at most this often per catalog, in seconds
+PRUNE_INTERVAL = 3600
+# How often each process checks for commits made by other processes
+CHANGE_POLL_INTERVAL = float(os.environ.get("STREAMTRACKER_CHANGE_POLL_SECONDS", "0.5"))
+
+_TRACKED = {models.Movie: "movie", models.TVShow: "tv_show"}
+
+
+class InvalidToken(ValueError):
+    """Raised when a sync token cannot be parsed"""
+
+
+def _reserve_sequence(session: Session, count: int) -> int:
+    """Reserve `count` change sequence values, returning the first one"""
+    connection = session.connection()
+    connection.execute(
+        text("UPDATE sync_state SET last_seq = last_seq + :count WHERE id = 1"), {"count": count}
+    )
+    last_seq = connection.execute(text("SELECT last_seq FROM sync_state WHERE id = 1")).scalar()
+    return last_seq - count + 1
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session: Session, flush_context, instances) -> None:
+    changed = [obj for obj in session.new if type(obj) in _TRACKED]
+    changed += [
+        obj for obj in session.dirty
+        if type(obj) in _TRACKED and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if type(obj) in _TRACKED]
+    if not changed and not deleted:
+        return
+
+    seq = _reserve_sequence(session, len(changed) + len(deleted))
+    now = datetime.utcnow()
+    flushed = session.info.setdefault("flushed_changes", [])
+    for obj in changed:
+        obj.change_seq = seq
+        obj.updated_at = now
+        flushed.append((obj, seq, "upsert"))
+        seq += 1
+    for obj in deleted:
+        session.add(models.Tombstone(
+            item_type=_TRACKED[type(obj)], item_id=obj.id, change_seq=seq, deleted_at=now
+        ))
+        flushed.append((obj, seq, "delete"))
+        seq += 1
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(session: Session, flush_context) -> None:
+    # New rows only have their ids once flushed, so events are built here
+    flushed = session.info.pop("flushed_changes", [])
+    session.info.setdefault("pending_events", []).extend(
+        {"seq": seq, "type": _TRACKED[type(obj)], "id": obj.id, "op": op}
+        for obj, seq, op in flushed
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(session: Session) -> None:
+    published = session.info.pop("pending_events", [])
+    catalog = session.info.get("catalog")
+    watcher.note_published(catalog, published)
+    events.broker.publish(published, catalog)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_events(session: Session) -> None:
+    session.info.pop("flushed_changes", None)
+    session.info.pop("pending_events", None)
+
+
+def ensure_sync_state(conn) -> None:
+    """Create the sync_state row if needed and prune expired tombstones"""
+    conn.execute(text("INSERT INTO sync_state (id, last_seq, pruned_seq) VALUES (1, 0, 0) "
+                      "ON CONFLICT (id) DO NOTHING"))
+    prune_tombstones(conn)
+
+
+def prune_tombstones(conn) -> None:
+    """Delete tombstones older than TOMBSTONE_RETENTION_DAYS, moving pruned_seq past them"""
+    cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    pruned = conn.execute(
+        text("SELECT max(change_seq) FROM tombstones WHERE deleted_at < :cutoff"), {"cutoff": cutoff}
+    ).scalar()
+    if pruned is not None:
+        conn.execute(text("DELETE FROM tombstones WHERE change_seq <= :seq"), {"seq": pruned})
+        conn.execute(
+            text("UPDATE sync_state SET pruned_seq = :seq WHERE id = 1 AND pruned_seq < :seq"), {"seq": pruned}
+        )
+
+
+def parse_token(token: Optional[str]) -> int:
+    """Turn a sync token into a change sequence value (0 means no token)"""
+    if not token:
+        return 0
+    try:
+        seq = int(token)
+    except ValueError:
+        raise InvalidToken(f"Invalid sync token: {token!r}")
+    if seq < 0:
+        raise InvalidToken(f"Invalid sync token: {token!r}")
+    return seq
+
+
+def current_token(db: Session) -> str:
+    """Sync token for the current state of the catalog"""
+    return str(db.execute(text("SELECT last_seq FROM sync_state WHERE id = 1")).scalar() or 0)
+
+
+def get_changes(db: Session, since: Optional[str] = None) -> dict:
+    """
+    Get the movies and TV shows written and the items deleted since a sync
+    token. Clients should apply the deletions first, then the upserts.
+    Without a token, or with one older than the retained tombstones, the
+    whole catalog is returned with reset=True so the client replaces its copy.
+    """
+    since_seq = parse_token(since)
+    if since_seq == 0:
+        return _full_catalog(db, _current_state(db))
+    return changes_since(db, since_seq)
+
+
+def changes_since(db: Session, since_seq: int) -> dict:
+    """
+    Get the changes past a change sequence value, 0 included (everything
+    written since the catalog was created). reset=True, with the whole
+    catalog, only if tombstones past `since_seq` have been pruned.
+    """
+    _prune_if_due(db)
+    state = _current_state(db)
+    token = str(state.last_seq)
+    if since_seq > state.last_seq:
+        raise InvalidToken(f"Sync token '{since_seq}' is ahead of the server")
+    if since_seq < state.pruned_seq:
+        return _full_catalog(db, state)
+
+    tombstones = db.query(models.Tombstone).filter(
+        models.Tombstone.change_seq > since_seq
+    ).order_by(models.Tombstone.change_seq).all()
+    return {
+        "token": token,
+        "reset": False,
+        "movies": db.query(models.Movie).filter(models.Movie.change_seq > since_seq).all(),
+        "tv_shows": db.query(models.TVShow).filter(models.TVShow.change_seq > since_seq).all(),
+        "deleted": [{"type": t.item_type, "id": t.item_id} for t in tombstones],
+    }
+
+
+def _current_state(db: Session):
+    # Reading the state first means changes committed meanwhile are returned
+    # again on the next sync rather than skipped
+    return db.execute(text("SELECT last_seq, pruned_seq FROM sync_state WHERE id = 1")).one()
+
+
+def _full_catalog(db: Session, state) -> dict:
+    return {
+        "token": str(state.last_seq),
+        "reset": True,
+        "movies": db.query(models.Movie).all(),
+        "tv_shows": db.query(models.TVShow).all(),
+        "deleted": [],
+    }
+
+
+# Catalog name -> when this process last pruned its tombstones
+_last_pruned: Dict[Optional[str], float] = {}
+_prune_lock = threading.Lock()
+
+
+def _prune_if_due(db: Session) -> None:
+    """Prune expired tombstones every PRUNE_INTERVAL, so long-running servers do not keep them all"""
+    catalog = db.info.get("catalog")
+    now = time.monotonic()
+    with _prune_lock:
+        if now - _last_pruned.get(catalog, float("-inf")) < PRUNE_INTERVAL:
+            return
+        _last_pruned[catalog] = now
+    # On a connection of its own, so the caller's session stays read-only
+    with db.get_bind().begin() as conn:
+        prune_tombstones(conn)
+
+
+class _Watch:
+    """Polling state of one watched catalog, on a connection of its own"""
+
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.watchers = 0
+        self.published: set = set()
+        # data_version is per connection, so every poll uses this one
+        self.conn = catalog.engine.connect()
+        try:
+            self.version = ChangeWatcher._data_version(self.conn)
+            self.watermark = ChangeWatcher._last_seq(self.conn)
+        finally:
+            self.conn.rollback()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class ChangeWatcher:
+    """
+    Background thread publishing changes committed by other processes, so
+    /events subscribers of every worker hear about every write. It polls
+    the change sequence (gated on SQLite by PRAGMA data_version, which changes
+    whenever another connection commits) and reads the rows and tombstones
+    past the last sequence it has seen.
+    Changes this process has already published itself are skipped.
+    The default catalog is always watched; a tenant catalog is watched
+    while this process has /events subscribers for it.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._watches: Dict[Optional[str], _Watch] = {}
+        # Watches no longer needed, closed by the watcher thread between polls
+        self._retired: List[_Watch] = []
+
+    def start(self) -> None:
+        if CHANGE_POLL_INTERVAL <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+        self.watch(default_catalog)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            retired = self._retired + list(self._watches.values())
+            self._watches, self._retired = {}, []
+        for watch in retired:
+            watch.close()
+
+    def watch(self, catalog: Catalog) -> None:
+        """Start (or keep) watching a catalog; every call is paired with unwatch()"""
+        if self._thread is None:
+            return
+        with self._lock:
+            watch = self._watches.get(catalog.name)
+            if watch is None:
+                watch = self._watches[catalog.name] = _Watch(catalog)
+            watch.watchers += 1
+
+    def unwatch(self, catalog: Catalog) -> None:
+        with self._lock:
+            watch = self._watches.get(catalog.name)
+            if watch is None:
+                return
+            watch.watchers -= 1
+            if not watch.watchers:
+                del self._watches[catalog.name]
+                self._retired.append(watch)
+
+    def note_published(self, catalog: Optional[str], published: list) -> None:
+        """Record sequences this process has published itself"""
+        if self._thread is None or not published:
+            return
+        with self._lock:
+            watch = self._watches.get(catalog)
+            if watch is not None:
+                watch.published.update(event["seq"] for event in published)
+
+    def _run(self) -> None:
+        while not self._stop.wait(CHANGE_POLL_INTERVAL):
+            with self._lock:
+                retired, self._retired = self._retired, []
+                watches = list(self._watches.values())
+            for watch in retired:
+                watch.close()
+            for watch in watches:
+                self._poll(watch)
+
+    def _poll(self, watch: _Watch) -> None:
+        conn = watch.conn
+        try:
+            current = self._data_version(conn)
+            if current is not None and current == watch.version:
+                return
+            watch.version = current
+            last_seq = self._last_seq(conn)
+            if last_seq != watch.watermark:
+                self._forward(watch, last_seq)
+                watch.watermark = last_seq
+        except Exception as e:
+            print(f"Change watcher warning: {e}")
+        finally:
+            # Never sit idle inside a transaction between polls
+            conn.rollback()
+
+    @staticmethod
+    def _data_version(conn) -> Optional[int]:
+        # SQLite bumps data_version on every commit from another connection,
+        # so most polls stop here; PostgreSQL has no equivalent and reads last_seq
+        if not IS_SQLITE:
+            return None
+        return conn.execute(text("PRAGMA data_version")).scalar()
+
+    @staticmethod
+    def _last_seq(conn) -> int:
+        return conn.execute(text("SELECT last_seq FROM sync_state WHERE id = 1")).scalar() or 0
+
+    def _forward(self, watch: _Watch, last_seq: int) -> None:
+        conn, watermark, catalog = watch.conn, watch.watermark, watch.catalog.name
+        with self._lock:
+            published, watch.published = watch.published, {seq for seq in watch.published if seq > last_seq}
+        if not events.broker.has_subscribers(catalog):
+            return
+        if last_seq < watermark or last_seq - watermark > events.MAX_BATCH_EVENTS:
+            # A restore, or a commit too large to list: subscribers resync
+            if last_seq not in published:
+                events.broker.publish([{"event": "resync", "seq": last_seq}], catalog)
+            return
+        window = {"after": watermark, "upto": last_seq}
+        found = []
+        for table, item_type in (("movies", "movie"), ("tv_shows", "tv_show")):
+            found += [
+                {"seq": seq, "type": item_type, "id": item_id, "op": "upsert"}
+                for item_id, seq in conn.execute(
+                    text(f"SELECT id, change_seq FROM {table} WHERE change_seq > :after AND change_seq <= :upto"),
+                    window,
+                )
+            ]
+        found += [
+            {"seq": seq, "type": item_type, "id": item_id, "op": "delete"}
+            for item_type, item_id, seq in conn.execute(
+                text("SELECT item_type, item_id, change_seq FROM tombstones "
+                     "WHERE change_seq > :after AND change_seq <= :upto"),
+                window,
+            )
+        ]
+        events.broker.publish(sorted(
+            (event for event in found if event["seq"] not in published), key=lambda event: event["seq"]
+        ), catalog)
+
+
+watcher = ChangeWatcher()
@@ -0,0 +1,165 @@
+"""
+Per-tenant catalogs for the StreamTracker API.
+
+Requests naming a tenant (the X-Tenant header, or a tenant query parameter
+ where headers cannot be set, e.g. EventSource) work on that tenant's own
+ SQLite file under tenants/ next to the database, so one tenant's writes
+ never lock another's and statistics only scan that tenant's rows.
+ Requests without a tenant use the default catalog as before.
+Tenant catalogs are opened (and migrated) on first use and kept in an LRU
+ cache of at most MAX_OPEN_TENANTS engines per process. Evicted catalogs
+ have their pooled connections closed, so thousands of tenants do not
+ exhaust file descriptors; a catalog still in use is never evicted.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from sqlalchemy.pool import QueuePool
+
+import migrations
+from database import IS_SQLITE, Catalog, create_sqlite_engine, db_path, default_catalog
+
+TENANT_DIR = os.path.join(os.path.dirname(os.path.abspath(db_path)), "tenants")
+# Tenant catalogs kept open per worker process
+MAX_OPEN_TENANTS = int(os.environ.get("STREAMTRACKER_MAX_OPEN_TENANTS", "64"))
+# Idle connections pooled per open tenant catalog (each holds a few file descriptors)
+TENANT_POOL_SIZE = 2
+# Extra connections a tenant catalog may open under load; closed once returned
+TENANT_MAX_OVERFLOW = 8
+
+TENANT_HEADER = "X-Tenant"
+# Tenant names become file names, so they are kept to a safe alphabet
+_TENANT_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class InvalidTenant(ValueError):
+    """Raised when a tenant name is not usable"""
+
+
+class TenantsUnavailable(RuntimeError):
+    """Raised when tenant catalogs are requested on a non-SQLite backend"""
+
+
+def tenant_name(tenant: str) -> str:
+    """Validate a tenant name, returning its canonical (lowercase) form"""
+    name = tenant.strip().lower()
+    if not _TENANT_NAME.match(name):
+        raise InvalidTenant(
+            "Tenant names are 1-64 letters, digits, '-' or '_', starting with a letter or digit"
+        )
+    return name
+
+
+def tenant_path(name: str) -> str:
+    return os.path.join(TENANT_DIR, f"{name}.db")
+
+
+class _TenantCatalog(Catalog):
+    def __init__(self, name: str):
+        path = tenant_path(name)
+        engine = create_sqlite_engine(
+            f"sqlite:///{path}", poolclass=QueuePool, pool_size=TENANT_POOL_SIZE, max_overflow=TENANT_MAX_OVERFLOW
+        )
+        super().__init__(name, engine, path)
+        self.leases = 0
+        self.ready = False
+        self.open_lock = threading.Lock()
+
+
+class TenantCatalogs:
+    """LRU cache of open tenant catalogs, leased to the requests using them"""
+
+    def __init__(self, capacity: int = MAX_OPEN_TENANTS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, _TenantCatalog]" = OrderedDict()
+        # Tenants this process has already migrated
+        self._migrated: set = set()
+        # Called with each tenant catalog the first time this process opens it
+        self.on_first_open: List[Callable[[Catalog], None]] = []
+
+    @property
+    def open_count(self) -> int:
+        with self._lock:
+            return len(self._open)
+
+    def open_names(self) -> List[str]:
+        """Tenants whose catalog this process has open"""
+        with self._lock:
+            return list(self._open)
+
+    def acquire(self, tenant: Optional[str]) -> Catalog:
+        """
+        Catalog of a tenant (the default catalog when `tenant` is empty),
+        opening it if needed. Every call is paired with release().
+        """
+        if not tenant:
+            return default_catalog
+        if not IS_SQLITE:
+            raise TenantsUnavailable("Tenant catalogs are only available with the SQLite backend")
+        name = tenant_name(tenant)
+        with self._lock:
+            catalog = self._open.get(name)
+            if catalog is None:
+                catalog = self._open[name] = _TenantCatalog(name)
+            else:
+                self._open.move_to_end(name)
+            catalog.leases += 1
+            evicted = self._evict()
+        self._close(evicted)
+        try:
+            self._ensure_ready(catalog)
+        except BaseException:
+            self.release(catalog)
+            raise
+        return catalog
+
+    def release(self, catalog: Catalog) -> None:
+        if catalog is default_catalog:
+            return
+        with self._lock:
+            catalog.leases -= 1
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _ensure_ready(self, catalog: _TenantCatalog) -> None:
+        if catalog.ready:
+            return
+        with catalog.open_lock:
+            if catalog.ready:
+                return
+            first_open = catalog.name not in self._migrated
+            if first_open:
+                os.makedirs(TENANT_DIR, exist_ok=True)
+                migrations.migrate(catalog)
+                self._migrated.add(catalog.name)
+            catalog.ready = True
+        if first_open:
+            for callback in self.on_first_open:
+                callback(catalog)
+
+    def _evict(self) -> List[_TenantCatalog]:
+        """Drop least recently used idle catalogs beyond capacity (call with the lock held)"""
+        evicted = []
+        for name in list(self._open):
+            if len(self._open) <= self.capacity:
+                break
+            if not self._open[name].leases:
+                evicted.append(self._open.pop(name))
+        return evicted
+
+    @staticmethod
+    def _close(evicted: List[_TenantCatalog]) -> None:
+        for catalog in evicted:
+            catalog.engine.dispose()
+
+    def close_all(self) -> None:
+        with self._lock:
+            evicted, self._open = list(self._open.values()), OrderedDict()
+        self._close(evicted)
+
+
+catalogs = TenantCatalogs()
@@ -0,0 +1,75 @@
+"""
+Shared fixtures for the StreamTracker API tests.
+
+The suite never touches the database the app is configured with: it runs
+ on a SQLite file in a temporary directory, or, when
+ STREAMTRACKER_TEST_BACKEND=postgresql, on the PostgreSQL database in
+ STREAMTRACKER_TEST_POSTGRES_URL (test_postgresql.py reruns the suite that
+ way). Every test starts from an empty catalog.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if os.environ.get("STREAMTRACKER_TEST_BACKEND") == "postgresql":
+    os.environ["STREAMTRACKER_DATABASE_URL"] = os.environ["STREAMTRACKER_TEST_POSTGRES_URL"]
+else:
+    os.environ.pop("STREAMTRACKER_DATABASE_URL", None)
+# movies.db, backups, job files and lock files go next to the working directory
+os.chdir(tempfile.mkdtemp(prefix="streamtracker-tests-"))
+os.environ["STREAMTRACKER_SNAPSHOT_INTERVAL_HOURS"] = "0"
+os.environ["STREAMTRACKER_DIFFERENTIAL_INTERVAL_MINUTES"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import backup  # noqa: E402
+import main  # noqa: E402
+from database import Base, engine  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        # Migrations run in the background once the app has started
+        main.initialization.wait()
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def empty_catalog(client):
+    """Delete every row and backup left behind by the previous test"""
+    shutil.rmtree(backup.BACKUP_DIR, ignore_errors=True)
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name != "sync_state":
+                conn.execute(table.delete())
+        conn.execute(text("UPDATE sync_state SET last_seq = 0, pruned_seq = 0 WHERE id = 1"))
+
+
+@pytest.fixture
+def add_movie(client):
+    def add(title, director, year, watched=False, rating=None, **fields):
+        response = client.post("/movies/", json=dict(
+            title=title, director=director, year=year, watched=watched, rating=rating, **fields
+        ))
+        assert response.status_code == 201, response.text
+        return response.json()
+    return add
+
+
+@pytest.fixture
+def add_tv_show(client):
+    def add(title, year, watched=False, rating=None, **fields):
+        response = client.post("/tv-shows/", json=dict(
+            title=title, year=year, watched=watched, rating=rating, **fields
+        ))
+        assert response.status_code == 201, response.text
+        return response.json()
+    return add
@@ -0,0 +1,130 @@
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+import backup
+from database import IS_SQLITE, engine
+
+pytestmark = pytest.mark.skipif(not IS_SQLITE, reason="backups are only available with the SQLite backend")
+
+
+def test_differential_on_top_of_the_first_snapshot(client, add_movie):
+    snapshot = client.post("/backups/snapshot/").json()
+    assert snapshot["seq"] == 0
+    add_movie("Heat", "Michael Mann", 1995)
+
+    response = client.post("/backups/differential/")
+    assert response.status_code == 200, response.text
+    assert (response.json()["from_seq"], response.json()["seq"]) == (0, 1)
+    # Nothing changed since
+    assert client.post("/backups/differential/").json() is None
+
+
+def test_restore_applies_differentials(client, add_movie):
+    snapshot = client.post("/backups/snapshot/").json()
+    heat = add_movie("Heat", "Michael Mann", 1995)
+    client.post("/backups/differential/")
+    add_movie("Thief", "Michael Mann", 1981)
+
+    response = client.post("/backups/restore/", json={"name": snapshot["name"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["differentials_applied"] == 1
+    assert [m["id"] for m in client.get("/movies/").json()] == [heat["id"]]
+
+
+def test_differentials_build_on_the_restored_state(client, add_movie):
+    heat = add_movie("Heat", "Michael Mann", 1995)
+    older = client.post("/backups/snapshot/").json()
+    add_movie("Thief", "Michael Mann", 1981)
+    newer = client.post("/backups/snapshot/").json()
+
+    restored = client.post("/backups/restore/", json={"name": older["name"], "apply_differentials": False}).json()
+    latest = [b for b in client.get("/backups/").json() if b["kind"] == "snapshot"][-1]
+    assert latest["name"] == restored["new_snapshot"]
+    assert latest["seq"] > newer["seq"]
+
+    alien = add_movie("Alien", "Ridley Scott", 1979)
+    response = client.post("/backups/differential/")
+    assert response.status_code == 200, response.text
+    assert response.json()["from_seq"] == latest["seq"]
+
+    client.post("/backups/restore/", json={"name": latest["name"]})
+    assert sorted(m["id"] for m in client.get("/movies/").json()) == [heat["id"], alien["id"]]
+
+
+def test_snapshot_finishes_under_steady_writes(client, add_movie):
+    movie = add_movie("Heat", "Michael Mann", 1995)
+    with engine.begin() as conn:
+        # Enough pages that a copy made a batch of pages at a time gets interrupted by commits
+        conn.execute(text(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10000) "
+            "INSERT INTO tv_shows (title, year, watched, review) SELECT 'Show ' || i, 2000, 0, printf('%.2000c', 'x') FROM n"
+        ))
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE movies SET watched = NOT watched WHERE id = :id"), {"id": movie["id"]})
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    snapshot = {}
+    copier = threading.Thread(target=lambda: snapshot.update(backup.create_snapshot()), daemon=True)
+    try:
+        copier.start()
+        copier.join(timeout=30)
+        assert not copier.is_alive(), "the snapshot did not finish while another connection kept writing"
+    finally:
+        stop.set()
+        writer.join()
+    assert snapshot["kind"] == "snapshot"
+
+
+def _tenant():
+    return {"X-Tenant": f"backup-{uuid.uuid4().hex[:8]}"}
+
+
+def test_tenant_catalogs_have_their_own_backups(client, add_movie):
+    tenant = _tenant()
+    add_movie("Heat", "Michael Mann", 1995)
+    snapshot = client.post("/backups/snapshot/", headers=tenant)
+    assert snapshot.status_code == 201, snapshot.text
+    thief = client.post("/movies/", headers=tenant, json={"title": "Thief", "director": "Michael Mann", "year": 1981})
+    assert client.post("/backups/differential/", headers=tenant).json()["seq"] == 1
+    client.post("/movies/", headers=tenant, json={"title": "Alien", "director": "Ridley Scott", "year": 1979})
+
+    # The default catalog's backups are kept apart
+    assert client.get("/backups/").json() == []
+    assert [b["kind"] for b in client.get("/backups/", headers=tenant).json()] == ["snapshot", "differential"]
+
+    response = client.post("/backups/restore/", headers=tenant, json={"name": snapshot.json()["name"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["differentials_applied"] == 1
+    assert [m["id"] for m in client.get("/movies/", headers=tenant).json()] == [thief.json()["id"]]
+    assert [m["title"] for m in client.get("/movies/").json()] == ["Heat"]
+
+
+def test_scheduler_backs_up_every_tenant(client, add_movie, monkeypatch):
+    monkeypatch.setattr(backup, "SNAPSHOT_INTERVAL_HOURS", 24)
+    monkeypatch.setattr(backup, "DIFFERENTIAL_INTERVAL_MINUTES", 60)
+    tenant = _tenant()
+    name = tenant["X-Tenant"]
+    client.post("/movies/", headers=tenant, json={"title": "Heat", "director": "Michael Mann", "year": 1995})
+
+    backup.scheduler.run_pending()
+    assert [b["kind"] for b in client.get("/backups/").json()] == ["snapshot"]
+    assert [b["kind"] for b in client.get("/backups/", headers=tenant).json()] == ["snapshot"]
+    assert name in backup._tenant_names()
+
+    # Nothing is due until the differential interval has passed
+    client.post("/movies/", headers=tenant, json={"title": "Thief", "director": "Michael Mann", "year": 1981})
+    backup.scheduler.run_pending()
+    assert len(client.get("/backups/", headers=tenant).json()) == 1
+    monkeypatch.setattr(backup, "DIFFERENTIAL_INTERVAL_MINUTES", 0.0001)
+    time.sleep(0.01)
+    backup.scheduler.run_pending()
+    assert [b["kind"] for b in client.get("/backups/", headers=tenant).json()] == ["snapshot", "differential"]
@@ -0,0 +1,19 @@
+"""
+Runs the benchmark harness on a small catalog, so it keeps working on both
+ backends. The timings themselves are not checked.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import benchmark  # noqa: E402
+
+
+def test_benchmarks_run(client):
+    results = benchmark.run(client, rows=300, repeat=2)
+    assert [result["name"] for result in results] == [
+        "seed and rebuild indexes", "facets", "search", "autocomplete", "fuzzy import (20 rows)",
+        "sync delta (50 writes)", "director statistics", "statistics dashboard", "duplicate clusters", "export",
+    ]
+    assert all(result["median_ms"] > 0 for result in results)
@@ -0,0 +1,157 @@
+"""
+The per-director aggregates (movie_count, rated_count, rating_sum) are kept
+ up to date by mapper events, so every way of writing movies is checked
+ against a full GROUP BY recount of the movies table.
+"""
+import random
+import time
+
+import pytest
+from sqlalchemy import text
+
+import directors
+import models
+from database import IS_SQLITE, SessionLocal, engine
+
+TITLES = ["Heat", "Thief", "Alien", "Point Break", "Strange Days", "Gladiator"]
+YEARS = [1981, 1995]
+DIRECTORS = ["Michael Mann", "michael mann", "Mîchael Mann", "Ridley Scott", "RIDLEY  SCOTT", "Kathryn Bigelow"]
+
+
+def _stored_aggregates(conn):
+    rows = conn.execute(text("SELECT id, movie_count, rated_count, rating_sum FROM directors"))
+    return {row.id: (row.movie_count, row.rated_count, float(row.rating_sum)) for row in rows}
+
+
+def _counted_aggregates(conn):
+    rows = conn.execute(text(
+        "SELECT director_id, count(*) AS movies, count(rating) AS rated, coalesce(sum(rating), 0) AS rating_sum "
+        "FROM movies WHERE director_id IS NOT NULL GROUP BY director_id"
+    ))
+    return {row.director_id: (row.movies, row.rated, float(row.rating_sum)) for row in rows}
+
+
+def assert_aggregates_match():
+    with engine.connect() as conn:
+        stored = _stored_aggregates(conn)
+        counted = _counted_aggregates(conn)
+        assert set(counted) <= set(stored)
+        # Directors whose movies are all gone keep their row, with zero counts
+        assert stored == {director_id: counted.get(director_id, (0, 0, 0.0)) for director_id in stored}
+        # Every movie is linked to the director its own spelling names
+        links = conn.execute(text(
+            "SELECT movies.director, directors.name_key FROM movies "
+            "LEFT JOIN directors ON directors.id = movies.director_id"
+        )).all()
+        for row in links:
+            assert row.name_key == (directors.director_key(row.director) or None), row
+
+
+def _random_movie(rng):
+    return dict(
+        title=rng.choice(TITLES),
+        director=rng.choice(DIRECTORS),
+        year=rng.choice(YEARS),
+        watched=rng.random() < 0.5,
+        rating=rng.choice([None, 3, 7, 8, 10]),
+    )
+
+
+def _run_rebuild(client):
+    job = client.post("/jobs/rebuild/").json()
+    deadline = time.monotonic() + 30
+    while job["status"] not in ("succeeded", "failed", "cancelled"):
+        assert time.monotonic() < deadline, job
+        time.sleep(0.05)
+        job = client.get(f"/jobs/{job['id']}").json()
+    assert job["status"] == "succeeded", job
+
+
+def _create(client, rng):
+    assert client.post("/movies/", json=_random_movie(rng)).status_code == 201
+
+
+def _update(client, rng):
+    movies = client.get("/movies/").json()
+    if not movies:
+        return
+    change = rng.choice([
+        {"director": rng.choice(DIRECTORS)},
+        {"rating": rng.choice([None, 1, 6, 9])},
+        {"director": rng.choice(DIRECTORS), "rating": rng.choice([None, 2, 5])},
+        {"title": rng.choice(TITLES)},
+    ])
+    assert client.put(f"/movies/{rng.choice(movies)['id']}", json=change).status_code == 200
+
+
+def _delete(client, rng):
+    movies = client.get("/movies/").json()
+    if movies:
+        assert client.delete(f"/movies/{rng.choice(movies)['id']}").status_code == 200
+
+
+def _import(client, rng):
+    # Titles repeat often, so imports both update matching movies and add new ones
+    movies = [_random_movie(rng) for _ in range(rng.randint(1, 4))]
+    response = client.post("/import/", json={"movies": movies, "tv_shows": []})
+    assert response.status_code == 200, response.text
+
+
+def _merge(client, rng):
+    assert client.post("/dedupe/merge/", json={"type": "movie"}).status_code == 200
+
+
+def test_aggregates_follow_every_write(client):
+    rng = random.Random(38)
+    operations = [_create] * 4 + [_update] * 3 + [_delete, _import, _merge]
+    for _ in range(150):
+        operation = rng.choice(operations)
+        operation(client, rng)
+        assert_aggregates_match()
+    _run_rebuild(client)
+    assert_aggregates_match()
+
+
+def _raw_sql(db):
+    db.execute(text("UPDATE movies SET rating = 4, director = 'Kathryn Bigelow'"))
+
+
+def _bulk_update(db):
+    db.query(models.Movie).update(
+        {models.Movie.rating: 4, models.Movie.director: "Kathryn Bigelow"}, synchronize_session=False
+    )
+
+
+@pytest.mark.parametrize("write", [_raw_sql, _bulk_update])
+def test_writes_bypassing_the_mapper_events_are_caught(client, add_movie, write):
+    add_movie("Heat", "Michael Mann", 1995, rating=8)
+    add_movie("Alien", "Ridley Scott", 1979)
+    assert_aggregates_match()
+
+    db = SessionLocal()
+    try:
+        write(db)
+        db.commit()
+    finally:
+        db.close()
+    with pytest.raises(AssertionError):
+        assert_aggregates_match()
+
+    # The rebuild job relinks and recounts every director
+    _run_rebuild(client)
+    assert_aggregates_match()
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="backups are only available with the SQLite backend")
+def test_aggregates_after_a_restore(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995, rating=8)
+    snapshot = client.post("/backups/snapshot/").json()
+    thief = add_movie("Thief", "michael mann", 1981, rating=7)
+    client.post("/backups/differential/")
+    client.put(f"/movies/{thief['id']}", json={"director": "Ridley Scott", "rating": None})
+    add_movie("Alien", "Ridley Scott", 1979, rating=9)
+
+    response = client.post("/backups/restore/", json={"name": snapshot["name"]})
+    assert response.status_code == 200, response.text
+    assert len(client.get("/movies/").json()) == 2
+    assert_aggregates_match()
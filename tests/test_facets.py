@@ -0,0 +1,101 @@
+from sqlalchemy import inspect, text
+
+import crud
+from database import SessionLocal, engine
+
+
+def _facets(client, **params):
+    response = client.get("/movies/", params=dict(params, facets="true"))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_facet_counts(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995, watched=True, rating=8)
+    add_movie("Collateral", "Michael Mann", 2004, watched=True, rating=7)
+    add_movie("Thief", "michael mann", 1981, rating=7)
+    add_movie("Alien", "Ridley Scott", 1979, watched=True)
+
+    result = _facets(client)
+    facets = result["facets"]
+    assert len(result["items"]) == facets["total"] == 4
+    assert facets["watched"] == {"watched": 3, "unwatched": 1}
+    assert facets["rating"] == {"7": 2, "8": 1, "unrated": 1}
+    assert facets["decade"] == {"1970s": 1, "1980s": 1, "1990s": 1, "2000s": 1}
+    # Both spellings belong to one director
+    assert facets["directors"][0] == {"director": "Michael Mann", "count": 3}
+    assert facets["directors"][1] == {"director": "Ridley Scott", "count": 1}
+
+
+def test_fractional_ratings_are_bucketed_by_their_integer_part(client, add_movie):
+    # Catalogs written by older versions hold fractional ratings
+    for rating in (7.9, 7.2, 8.5):
+        movie = add_movie(f"Movie {rating}", "Some Director", 2000)
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE movies SET rating = :rating WHERE id = :id"), {"rating": rating, "id": movie["id"]})
+
+    db = SessionLocal()
+    try:
+        assert crud.get_movie_facets(db)["rating"] == {"7": 2, "8": 1}
+    finally:
+        db.close()
+
+
+def test_movies_without_a_director_are_left_out_of_the_director_facet(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995)
+    # A name with nothing to key on, and a NULL written by an older version
+    add_movie("Untitled", "???", 2001)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO movies (title, year, watched) VALUES ('Unknown', 2002, false)"))
+
+    assert _facets(client, max_year=2001)["facets"]["directors"] == [{"director": "Michael Mann", "count": 1}]
+    db = SessionLocal()
+    try:
+        for filters in ({}, {"min_year": 1990}):
+            facets = crud.get_movie_facets(db, **filters)
+            assert facets["total"] == 3
+            assert facets["directors"] == [{"director": "Michael Mann", "count": 1}]
+    finally:
+        db.close()
+
+
+def test_facet_columns_are_indexed(client):
+    inspector = inspect(engine)
+    for table, columns in {"movies": ["year", "rating", "watched", "director_id"], "tv_shows": ["year", "rating", "watched"]}.items():
+        indexed = {tuple(index["column_names"]) for index in inspector.get_indexes(table)}
+        for column in columns:
+            assert (column,) in indexed, (table, column)
+
+
+def test_facets_follow_filters(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995, watched=True, rating=8)
+    add_movie("Thief", "Michael Mann", 1981, rating=7)
+    add_movie("Alien", "Ridley Scott", 1979, watched=True, rating=8)
+
+    facets = _facets(client, watched="true")["facets"]
+    assert facets["total"] == 2
+    assert {d["director"]: d["count"] for d in facets["directors"]} == {"Michael Mann": 1, "Ridley Scott": 1}
+
+    facets = _facets(client, decade=1970)["facets"]
+    assert facets["total"] == 1
+    assert facets["decade"] == {"1970s": 1}
+
+
+def test_director_filter_matches_every_spelling(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995)
+    add_movie("Thief", "MICHAEL MANN", 1981)
+    add_movie("Alien", "Ridley Scott", 1979)
+
+    titles = sorted(m["title"] for m in client.get("/movies/", params={"director": "michael  mann"}).json())
+    assert titles == ["Heat", "Thief"]
+    assert client.get("/movies/", params={"director": "Nobody"}).json() == []
+
+
+def test_tv_show_facets(client, add_tv_show):
+    add_tv_show("The Wire", 2002, watched=True, rating=9)
+    add_tv_show("Twin Peaks", 1990, rating=8)
+
+    facets = client.get("/tv-shows/", params={"facets": "true"}).json()["facets"]
+    assert facets["total"] == 2
+    assert facets["rating"] == {"8": 1, "9": 1}
+    assert facets["directors"] == []
@@ -0,0 +1,90 @@
+import models
+import title_index
+from database import SessionLocal
+
+
+def _import(client, movies=(), tv_shows=()):
+    response = client.post("/import/", json={"movies": list(movies), "tv_shows": list(tv_shows)})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["errors"] == []
+    return result
+
+
+def _movie(title, director, year=2000, watched=False, **fields):
+    return dict(title=title, director=director, year=year, watched=watched, **fields)
+
+
+def test_normalized_titles_update_existing_movies(client, add_movie):
+    existing = add_movie("The Godfather", "Francis Ford Coppola", 1972)
+
+    result = _import(client, movies=[
+        _movie("Godfather, The", "francis ford coppola", 1972, rating=9),
+        _movie("The Gódfather", "Francis Ford Coppola", 1972, watched=True),
+    ])
+    assert (result["movies_created"], result["movies_updated"]) == (0, 2)
+    movie = client.get(f"/movies/{existing['id']}").json()
+    assert (movie["rating"], movie["watched"]) == (9, True)
+
+
+def test_near_identical_titles_match(client, add_movie):
+    add_movie("Eternal Sunshine of the Spotless Mind", "Michel Gondry", 2004)
+
+    result = _import(client, movies=[_movie("Eternal Sunshine of the Spotles Mind", "Michel Gondry", 2004)])
+    assert (result["movies_created"], result["movies_updated"]) == (0, 1)
+    assert len(client.get("/movies/").json()) == 1
+
+
+def test_fuzzy_matching_requires_the_director_and_numbers(client, add_movie):
+    add_movie("The Godfather", "Francis Ford Coppola", 1972)
+
+    result = _import(client, movies=[
+        _movie("The Godfather", "Someone Else", 1972),
+        _movie("The Godfather II", "Francis Ford Coppola", 1974),
+    ])
+    assert (result["movies_created"], result["movies_updated"]) == (2, 0)
+
+
+def test_tv_shows_match_on_title_and_year(client, add_tv_show):
+    add_tv_show("Breaking Bad", 2008)
+
+    result = _import(client, tv_shows=[
+        dict(title="breaking bad", year=2008, watched=True, seasons=5),
+        dict(title="Breaking Bad", year=2030, watched=False),
+    ])
+    assert (result["tv_shows_created"], result["tv_shows_updated"]) == (1, 1)
+
+
+def _bulk_add(rows):
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_tv_show_match_is_not_crowded_out_by_other_years(client):
+    # More titles than the trigram lookup keeps as candidates, all closer to
+    # the imported one than the show it should match, but from other years
+    title = "Law and Order Special Victim Unit"
+    _bulk_add([
+        models.TVShow(title=title, year=1950 + i % 40, watched=False)
+        for i in range(title_index.MAX_CANDIDATES + 50)
+    ])
+    _bulk_add([models.TVShow(title="Law & Order: Special Victims Unit", year=1999, watched=False)])
+
+    result = _import(client, tv_shows=[dict(title=title, year=1999, watched=True)])
+    assert (result["tv_shows_created"], result["tv_shows_updated"]) == (0, 1)
+
+
+def test_movie_match_is_not_crowded_out_by_other_directors(client):
+    title = "Night of the Living Deads"
+    _bulk_add([
+        models.Movie(title=title, director=f"Director {i}", year=1968, watched=False)
+        for i in range(title_index.MAX_CANDIDATES + 50)
+    ])
+    _bulk_add([models.Movie(title="Night of the Living Dead", director="George A. Romero", year=1968, watched=False)])
+
+    result = _import(client, movies=[_movie(title, "George A. Romero", 1968)])
+    assert (result["movies_created"], result["movies_updated"]) == (0, 1)
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+import models
+from database import SessionLocal, default_catalog
+
+
+def _add_job(status, owner, heartbeat_at, kind=jobs.IMPORT, payload=None):
+    job_id = uuid.uuid4().hex
+    if payload is not None:
+        os.makedirs(jobs.JOB_DIR, exist_ok=True)
+        with open(jobs._payload_path(job_id), "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+    db = SessionLocal()
+    try:
+        db.add(models.Job(
+            id=job_id, kind=kind, status=status, created_at=datetime.utcnow(), total_rows=0, processed_rows=0,
+            error_count=0, cancel_requested=False, owner=owner, heartbeat_at=heartbeat_at,
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return job_id
+
+
+def _job(job_id):
+    db = SessionLocal()
+    try:
+        return jobs.get_job(db, job_id)
+    finally:
+        db.close()
+
+
+def _wait_until_finished(job_id):
+    deadline = time.monotonic() + 30
+    while _job(job_id).status not in jobs.FINISHED_STATES:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return _job(job_id)
+
+
+def _stale():
+    return datetime.utcnow() - timedelta(seconds=jobs.HEARTBEAT_TIMEOUT + 5)
+
+
+def test_jobs_of_a_worker_that_stopped_are_taken_over(client):
+    payload = {"movies": [{"title": "Heat", "director": "Michael Mann", "year": 1995}], "tv_shows": []}
+    running = _add_job(jobs.RUNNING, "other-host:1:dead", _stale(), payload=payload)
+    # Left behind by a graceful shutdown, which clears the heartbeat
+    queued = _add_job(jobs.QUEUED, "other-host:2:gone", None, kind=jobs.REBUILD)
+
+    assert jobs.manager.reclaim() == 2
+    for job_id in (running, queued):
+        job = _wait_until_finished(job_id)
+        assert (job.status, job.owner) == (jobs.SUCCEEDED, jobs.WORKER_ID)
+    assert [m["title"] for m in client.get("/movies/").json()] == ["Heat"]
+
+
+def test_jobs_with_a_recent_heartbeat_are_left_alone(client):
+    job_id = _add_job(jobs.RUNNING, "other-host:1:alive", datetime.utcnow())
+    assert jobs.manager.reclaim() == 0
+    assert (_job(job_id).status, _job(job_id).owner) == (jobs.RUNNING, "other-host:1:alive")
+
+
+def test_heartbeats_keep_jobs_with_their_worker(client, monkeypatch):
+    job_id = _add_job(jobs.RUNNING, jobs.WORKER_ID, _stale())
+    monkeypatch.setitem(jobs.manager._pending, job_id, None)
+    jobs.manager.heartbeat()
+    assert _job(job_id).heartbeat_at > datetime.utcnow() - timedelta(seconds=jobs.HEARTBEAT_TIMEOUT)
+    assert jobs.manager.reclaim() == 0
+
+
+def test_a_job_taken_over_stops_on_its_old_worker(client):
+    job_id = _add_job(jobs.RUNNING, jobs.WORKER_ID, datetime.utcnow())
+    db = SessionLocal()
+    try:
+        ctx = jobs.JobContext(default_catalog, db, jobs.get_job(db, job_id))
+        ctx.check_cancelled()
+        db.query(models.Job).filter(models.Job.id == job_id).update({models.Job.owner: "other-host:1:new"})
+        db.commit()
+        with pytest.raises(jobs.JobReclaimed):
+            ctx.check_cancelled()
+    finally:
+        db.close()
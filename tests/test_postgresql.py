@@ -0,0 +1,49 @@
+"""
+Runs the whole suite again on PostgreSQL, in a process of its own since
+ the backend is chosen when the app is imported. Point
+ STREAMTRACKER_TEST_POSTGRES_URL at a scratch database (its rows are
+ deleted) whose server has the pg_trgm extension; without it this test is
+ skipped. With STREAMTRACKER_TEST_REQUIRE_POSTGRES=1 (as in CI) an
+ unreachable server fails the test instead.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from database import IS_SQLITE
+
+POSTGRES_URL = os.environ.get("STREAMTRACKER_TEST_POSTGRES_URL")
+REQUIRE_POSTGRES = os.environ.get("STREAMTRACKER_TEST_REQUIRE_POSTGRES") == "1"
+
+
+def _reachable(url: str) -> bool:
+    engine = create_engine(url)
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="already running on PostgreSQL")
+@pytest.mark.skipif(not POSTGRES_URL and not REQUIRE_POSTGRES, reason="STREAMTRACKER_TEST_POSTGRES_URL is not set")
+def test_suite_on_postgresql():
+    if not POSTGRES_URL or not _reachable(POSTGRES_URL):
+        message = f"PostgreSQL is not available at {POSTGRES_URL}"
+        if REQUIRE_POSTGRES:
+            pytest.fail(message)
+        pytest.skip(message)
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", tests_dir],
+        env=dict(os.environ, STREAMTRACKER_TEST_BACKEND="postgresql"),
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,76 @@
+def _search(client, q, **params):
+    response = client.get("/search/", params=dict(params, q=q))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_whole_words_rank_before_prefixes(client, add_movie, add_tv_show):
+    add_movie("Starship Troopers", "Paul Verhoeven", 1997)
+    add_movie("Star Wars", "George Lucas", 1977)
+    add_tv_show("Star Trek", 1966)
+
+    result = _search(client, "star")
+    assert result["total"] == 3
+    assert [item["title"] for item in result["items"]][2] == "Starship Troopers"
+    assert {item["type"] for item in result["items"]} == {"movie", "tv_show"}
+
+    shows = _search(client, "star", type="tv_show")
+    assert [item["title"] for item in shows["items"]] == ["Star Trek"]
+
+
+def test_directors_are_searched(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995)
+    add_movie("Mann of Steel", "Someone Else", 2013)
+
+    titles = [item["title"] for item in _search(client, "mann")["items"]]
+    # Titles weigh more than directors
+    assert titles == ["Mann of Steel", "Heat"]
+
+
+def test_best_hit_is_found_among_many_matches(client, add_movie):
+    for i in range(1200):
+        add_movie(f"Love Story Of The Long Night {i}", "Some Director", 2000)
+    exact = add_movie("Love", "Another Director", 2001)
+
+    result = _search(client, "love", limit=5)
+    assert result["total"] == 1201
+    assert result["items"][0]["id"] == exact["id"]
+
+
+def test_pages_neither_overlap_nor_skip(client, add_movie):
+    for i in range(60):
+        add_movie(f"Night Train {i}", "Some Director", 1990 + i % 10)
+
+    ids = []
+    for offset in range(0, 60, 25):
+        ids += [item["id"] for item in _search(client, "night", limit=25, offset=offset)["items"]]
+    assert len(ids) == len(set(ids)) == 60
+
+
+def test_typos_fall_back_to_fuzzy_matching(client, add_movie):
+    add_movie("The Shawshank Redemption", "Frank Darabont", 1994)
+
+    result = _search(client, "shawshenk redemption")
+    assert [item["title"] for item in result["items"]] == ["The Shawshank Redemption"]
+
+
+def test_fuzzy_total_does_not_depend_on_the_page(client, add_movie, add_tv_show):
+    for number in range(1, 6):
+        add_movie(f"Shawshank Redemption {number}", "Frank Darabont", 1994 + number)
+    add_tv_show("Shawshank Redemption", 2030)
+
+    pages = [_search(client, "shawshenk redemption", limit=2, offset=offset) for offset in (0, 2, 4)]
+    assert [page["total"] for page in pages] == [6, 6, 6]
+    ids = [(item["type"], item["id"]) for page in pages for item in page["items"]]
+    assert len(ids) == len(set(ids)) == 6
+    assert _search(client, "shawshenk redemption", type="tv_show")["total"] == 1
+
+
+def test_autocomplete(client, add_movie, add_tv_show):
+    add_movie("Interstellar", "Christopher Nolan", 2014)
+    add_tv_show("Interview with the Vampire", 2022)
+    add_movie("Heat", "Intern Director", 1995)
+
+    suggestions = client.get("/search/", params={"q": "inter", "autocomplete": "true"}).json()
+    # Titles only: a director matching the prefix is not a suggestion
+    assert sorted(s["title"] for s in suggestions) == ["Interstellar", "Interview with the Vampire"]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import sync
+from database import SessionLocal, engine
+
+
+def _sync(client, since=None):
+    response = client.get("/sync", params={"since": since} if since is not None else {})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_no_token_returns_the_whole_catalog(client, add_movie, add_tv_show):
+    add_movie("Heat", "Michael Mann", 1995)
+    add_tv_show("The Wire", 2002)
+
+    changes = _sync(client)
+    assert changes["reset"] is True
+    assert [m["title"] for m in changes["movies"]] == ["Heat"]
+    assert [s["title"] for s in changes["tv_shows"]] == ["The Wire"]
+    assert changes["token"] == "2"
+
+
+def test_token_returns_only_later_changes(client, add_movie):
+    heat = add_movie("Heat", "Michael Mann", 1995)
+    thief = add_movie("Thief", "Michael Mann", 1981)
+    token = _sync(client)["token"]
+
+    client.put(f"/movies/{heat['id']}", json={"rating": 8})
+    client.delete(f"/movies/{thief['id']}")
+    alien = add_movie("Alien", "Ridley Scott", 1979)
+
+    changes = _sync(client, token)
+    assert changes["reset"] is False
+    assert sorted(m["id"] for m in changes["movies"]) == sorted([heat["id"], alien["id"]])
+    assert changes["deleted"] == [{"type": "movie", "id": thief["id"]}]
+    assert int(changes["token"]) == int(token) + 3
+
+    caught_up = _sync(client, changes["token"])
+    assert (caught_up["movies"], caught_up["deleted"]) == ([], [])
+
+
+def test_invalid_tokens_are_rejected(client, add_movie):
+    add_movie("Heat", "Michael Mann", 1995)
+    assert client.get("/sync", params={"since": "abc"}).status_code == 400
+    assert client.get("/sync", params={"since": "-1"}).status_code == 400
+    assert client.get("/sync", params={"since": "99"}).status_code == 400
+
+
+def test_expired_tombstones_force_a_reset(client, add_movie):
+    heat = add_movie("Heat", "Michael Mann", 1995)
+    thief = add_movie("Thief", "Michael Mann", 1981)
+    token = _sync(client)["token"]
+    client.delete(f"/movies/{heat['id']}")
+    client.delete(f"/movies/{thief['id']}")
+    expired = datetime.utcnow() - timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 1)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE tombstones SET deleted_at = :expired WHERE item_id = :id"),
+                     {"expired": expired, "id": heat["id"]})
+        sync.prune_tombstones(conn)
+
+    assert _sync(client, token)["reset"] is True
+    # Tokens past the pruned tombstones still get a delta
+    later = _sync(client, str(int(token) + 1))
+    assert later["reset"] is False
+    assert later["deleted"] == [{"type": "movie", "id": thief["id"]}]
+
+
+def test_changes_since_sequence_zero(client, add_movie):
+    heat = add_movie("Heat", "Michael Mann", 1995)
+    db = SessionLocal()
+    try:
+        changes = sync.changes_since(db, 0)
+    finally:
+        db.close()
+    assert changes["reset"] is False
+    assert [m.id for m in changes["movies"]] == [heat["id"]]
+
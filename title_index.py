@@ -0,0 +1,323 @@
+"""
+Typo-tolerant title matching for the StreamTracker API.
+
+Every movie and TV show stores a normalized form of its title (lowercase,
+ accents and punctuation stripped, leading/trailing English articles
+ removed), and the trigrams of that form are kept in the title_trigrams
+ table by mapper events. Fuzzy lookups use the trigram index to fetch a
+ small candidate set and score only those candidates. On PostgreSQL the
+ candidates come from pg_trgm's similarity operator over a GIN index on
+ title_normalized instead, and the title_trigrams table is left empty.
+"""
+import json
+import math
+import re
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import and_, bindparam, delete, event, func, insert, inspect, select, text
+from sqlalchemy.orm import Session
+
+import models
+from database import IS_SQLITE
+
+# Minimum trigram similarity for a title to count as a match on import
+IMPORT_MATCH_THRESHOLD = 0.8
+# Minimum trigram similarity for fuzzy search results
+SEARCH_MATCH_THRESHOLD = 0.4
+# Upper bound on candidates fetched from the trigram index per lookup
+MAX_CANDIDATES = 200
+# Postings counted per trigram when picking the rarest trigrams of a lookup
+DF_PROBE_LIMIT = 500
+
+MOVIE = "movie"
+TV_SHOW = "tv_show"
+
+_ARTICLES = ("the", "a", "an")
+# Arabic or roman numerals, which usually tell sequels and seasons apart
+_NUMBER_TOKEN = re.compile(r"^(?:\d+|[ivx]+)$")
+_LEADING_ARTICLE = re.compile(r"^(?:%s)\s+" % "|".join(_ARTICLES))
+_TRAILING_ARTICLE = re.compile(r",\s*(?:%s)$" % "|".join(_ARTICLES))
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """
+    Normalize a title for matching, so that "The Godfather", "Godfather, The"
+    and "the godfather" all compare equal and accents are ignored.
+    """
+    if not title:
+        return ""
+    value = unicodedata.normalize("NFKD", title)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch)).casefold().strip()
+    value = _TRAILING_ARTICLE.sub("", value)
+    value = _LEADING_ARTICLE.sub("", value)
+    value = value.replace("&", " and ")
+    value = re.sub(r"[^\w]+", " ", value)
+    return " ".join(value.split())
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Normalize a person's name for matching (case, accents and punctuation)"""
+    if not name:
+        return ""
+    value = unicodedata.normalize("NFKD", name)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.sub(r"[^\w]+", " ", value).split())
+
+
+def title_trigrams(normalized: str) -> set[str]:
+    """Trigrams of a normalized title, with each word padded like pg_trgm"""
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def title_numbers(normalized: str) -> frozenset:
+    """Number tokens (digits or roman numerals) of a normalized title, e.g. sequel numbers"""
+    return frozenset(token for token in normalized.split() if _NUMBER_TOKEN.match(token))
+
+
+def similarity(a: str, b: str) -> float:
+    """Trigram (Jaccard) similarity of two normalized titles, from 0.0 to 1.0"""
+    if a == b:
+        return 1.0
+    trigrams_a, trigrams_b = title_trigrams(a), title_trigrams(b)
+    if not trigrams_a or not trigrams_b:
+        return 0.0
+    shared = len(trigrams_a & trigrams_b)
+    return shared / (len(trigrams_a) + len(trigrams_b) - shared)
+
+
+def _item_type(model) -> str:
+    return MOVIE if model is models.Movie else TV_SHOW
+
+
+# The trigrams of a lookup are passed as one JSON array parameter and joined
+# through json_each, so both statements have a fixed text that SQLAlchemy and
+# SQLite compile once instead of once per distinct set of trigrams
+_POSTING_COUNTS = text(
+    "SELECT j.value AS trigram, ("
+    " SELECT count(*) FROM (SELECT 1 FROM title_trigrams t"
+    " WHERE t.item_type = :item_type AND t.trigram = j.value LIMIT :probe_limit)"
+    ") AS postings FROM json_each(:trigrams) AS j"
+)
+# CROSS JOIN keeps json_each as the outer loop, so each trigram is one index
+# lookup; with "trigram IN (...)" SQLite prefers walking the whole primary key
+# to avoid sorting for the GROUP BY
+_CANDIDATES = text(
+    "SELECT t.item_id, count(*) AS shared FROM json_each(:trigrams) AS j"
+    " CROSS JOIN title_trigrams AS t ON t.item_type = :item_type AND t.trigram = j.value"
+    " GROUP BY t.item_id ORDER BY shared DESC LIMIT :limit"
+)
+
+
+def _filtered_candidates(model, query_filter):
+    """
+    _CANDIDATES restricted to the rows of `model` matching `query_filter`
+    before the LIMIT, so that a match in the filtered set (e.g. the same
+    year) is never crowded out by better candidates that the filter rejects
+    """
+    trigrams = models.TitleTrigram
+    probe = func.json_each(bindparam("trigrams")).table_valued("value").alias("j")
+    return (
+        select(trigrams.item_id, func.count().label("shared"))
+        .select_from(probe)
+        .join(trigrams, and_(trigrams.item_type == bindparam("item_type"), trigrams.trigram == probe.c.value))
+        .where(trigrams.item_id.in_(select(model.id).where(query_filter)))
+        .group_by(trigrams.item_id)
+        .order_by(func.count().desc())
+        .limit(bindparam("limit"))
+    )
+
+
+# PostgreSQL: pg_trgm candidates ("%" uses pg_trgm.similarity_threshold, 0.3
+# by default, which is below every threshold used here)
+PG_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_movies_title_normalized_trgm ON movies USING gin (title_normalized gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_tv_shows_title_normalized_trgm ON tv_shows USING gin (title_normalized gin_trgm_ops)",
+]
+
+
+def ensure_pg_title_indexes(conn) -> None:
+    """Create the pg_trgm indexes used for fuzzy title lookups on PostgreSQL"""
+    for statement in PG_SCHEMA:
+        conn.execute(text(statement))
+
+
+def _pg_candidate_ids(db: Session, model, normalized: str, query_filter=None) -> List[int]:
+    similar = func.similarity(model.title_normalized, normalized)
+    query = select(model.id).where(model.title_normalized.op("%")(normalized))
+    if query_filter is not None:
+        query = query.where(query_filter)
+    return list(db.execute(query.order_by(similar.desc()).limit(MAX_CANDIDATES)).scalars())
+
+
+def _rarest_trigrams(db: Session, item_type: str, trigrams: set[str], count: int) -> List[str]:
+    """Pick the `count` trigrams with the fewest postings (counted up to DF_PROBE_LIMIT)"""
+    if count >= len(trigrams):
+        return sorted(trigrams)
+    frequency = {
+        row.trigram: row.postings for row in db.execute(_POSTING_COUNTS, {
+            "item_type": item_type, "trigrams": json.dumps(sorted(trigrams)), "probe_limit": DF_PROBE_LIMIT,
+        })
+    }
+    return sorted(trigrams, key=lambda trigram: (frequency[trigram], trigram))[:count]
+
+
+def rank_similar(
+    db: Session,
+    model,
+    title: str,
+    threshold: float = SEARCH_MATCH_THRESHOLD,
+    query_filter=None,
+    same_numbers: bool = False,
+) -> List[tuple]:
+    """
+    Score the titles of `model` similar to `title`, returning every
+    (id, similarity) pair with similarity >= threshold among the at most
+    MAX_CANDIDATES candidates of the trigram index, best first.
+    `query_filter` is an optional extra SQLAlchemy condition on `model`,
+    applied before the candidates are cut to MAX_CANDIDATES.
+    With `same_numbers`, titles whose number tokens differ never match, so
+    "Movie 12" is not taken for "Movie 120" or "Rocky II" for "Rocky III".
+    """
+    normalized = normalize_title(title)
+    trigrams = title_trigrams(normalized)
+    if not trigrams:
+        return []
+    if IS_SQLITE:
+        item_type = _item_type(model)
+        # A title sharing fewer trigrams than this cannot reach the threshold, so
+        # every match contains at least one of any (len - min_shared + 1) of the
+        # query trigrams. Only the rarest ones are scanned (prefix filtering),
+        # which keeps common trigrams such as " th" from making lookups linear.
+        min_shared = max(1, math.ceil(threshold * len(trigrams)))
+        probe = _rarest_trigrams(db, item_type, trigrams, len(trigrams) - min_shared + 1)
+        statement = _CANDIDATES if query_filter is None else _filtered_candidates(model, query_filter)
+        candidate_ids = [
+            row.item_id for row in db.execute(statement, {
+                "item_type": item_type, "trigrams": json.dumps(probe), "limit": MAX_CANDIDATES,
+            })
+        ]
+    else:
+        candidate_ids = _pg_candidate_ids(db, model, normalized, query_filter)
+    if not candidate_ids:
+        return []
+    # Score on the normalized titles alone
+    query = db.query(model.id, model.title_normalized).filter(model.id.in_(candidate_ids))
+    numbers = title_numbers(normalized)
+    scored = [
+        (item_id, similarity(normalized, value or ""))
+        for item_id, value in query
+        if not same_numbers or title_numbers(value or "") == numbers
+    ]
+    return sorted((pair for pair in scored if pair[1] >= threshold), key=lambda pair: (-pair[1], pair[0]))
+
+
+def find_similar(
+    db: Session,
+    model,
+    title: str,
+    threshold: float = SEARCH_MATCH_THRESHOLD,
+    limit: int = 10,
+    query_filter=None,
+    same_numbers: bool = False,
+) -> List[tuple]:
+    """
+    Find rows of `model` whose title is similar to `title`, returning the
+    best `limit` (row, similarity) pairs of rank_similar, which takes the
+    same arguments.
+    """
+    scored = rank_similar(db, model, title, threshold, query_filter, same_numbers)[:limit]
+    if not scored:
+        return []
+    # Load only the rows returned
+    rows = {row.id: row for row in db.query(model).filter(model.id.in_([item_id for item_id, _ in scored]))}
+    return [(rows[item_id], score) for item_id, score in scored if item_id in rows]
+
+
+def _trigram_rows(item_type: str, item_id: int, normalized: str) -> List[dict]:
+    return [
+        {"item_type": item_type, "item_id": item_id, "trigram": trigram}
+        for trigram in title_trigrams(normalized)
+    ]
+
+
+def _set_normalized_title(mapper, connection, target):
+    target.title_normalized = normalize_title(target.title)
+
+
+def _index_inserted(mapper, connection, target):
+    rows = _trigram_rows(_item_type(type(target)), target.id, target.title_normalized)
+    if rows:
+        connection.execute(insert(models.TitleTrigram), rows)
+
+
+def _index_updated(mapper, connection, target):
+    if not inspect(target).attrs.title.history.has_changes():
+        return
+    _index_deleted(mapper, connection, target)
+    _index_inserted(mapper, connection, target)
+
+
+def _index_deleted(mapper, connection, target):
+    connection.execute(
+        delete(models.TitleTrigram).where(
+            models.TitleTrigram.item_type == _item_type(type(target)),
+            models.TitleTrigram.item_id == target.id,
+        )
+    )
+
+
+for _model in (models.Movie, models.TVShow):
+    event.listen(_model, "before_insert", _set_normalized_title)
+    event.listen(_model, "before_update", _set_normalized_title)
+    if IS_SQLITE:
+        event.listen(_model, "after_insert", _index_inserted)
+        event.listen(_model, "after_update", _index_updated)
+        event.listen(_model, "after_delete", _index_deleted)
+
+
+def backfill_title_index(conn, rebuild: bool = False) -> int:
+    """
+    Fill in title_normalized and trigrams (SQLite only) for rows written
+    before the title index existed or by raw SQL (or for every row when
+    rebuild=True).
+    Returns the number of rows indexed.
+    """
+    if rebuild and IS_SQLITE:
+        conn.execute(text("DELETE FROM title_trigrams"))
+    indexed = 0
+    for table, item_type in (("movies", MOVIE), ("tv_shows", TV_SHOW)):
+        condition = "" if rebuild else " WHERE title_normalized IS NULL"
+        rows = conn.execute(text(f"SELECT id, title FROM {table}{condition}")).all()
+        if not rows:
+            continue
+        normalized = [(row.id, normalize_title(row.title)) for row in rows]
+        conn.execute(
+            text(f"UPDATE {table} SET title_normalized = :normalized WHERE id = :id"),
+            [{"id": item_id, "normalized": value} for item_id, value in normalized],
+        )
+        indexed += len(rows)
+        if not IS_SQLITE:
+            continue
+        if not rebuild:
+            ids = [item_id for item_id, _ in normalized]
+            for start in range(0, len(ids), 500):
+                conn.execute(
+                    delete(models.TitleTrigram).where(
+                        models.TitleTrigram.item_type == item_type,
+                        models.TitleTrigram.item_id.in_(ids[start:start + 500]),
+                    )
+                )
+        trigram_rows = [
+            trigram_row
+            for item_id, value in normalized
+            for trigram_row in _trigram_rows(item_type, item_id, value)
+        ]
+        if trigram_rows:
+            conn.execute(insert(models.TitleTrigram), trigram_rows)
+    return indexed